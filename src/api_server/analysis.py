@@ -0,0 +1,97 @@
+import typing
+
+import numpy as np
+
+from .detection import ScenePrefilter
+from .frame_ring import get_frame_ring
+from .img import detect_area_changes
+from .img import learn_background
+from .roi import Region
+from .roi import RoiMask
+from .spots import detect_spots
+
+# probability of similarity, scores of tiles, score limit of changed tile
+# and bright spots
+Changes = typing.Tuple[int, np.ndarray, float, typing.List[dict]]
+
+
+class CameraAnalysis:
+    """Detection state of camera which is kept in the worker process
+    of the camera: the prefilter, own copy of the previous area (the slot
+    of ring is reused), regions of view and the background model
+    of the camera.
+    """
+    camera: str
+    prefilter: ScenePrefilter
+    prev_area: typing.Optional[np.ndarray]
+    # copy of the regions of the camera in the server process
+    roi: RoiMask
+
+    def __init__(self, camera: str):
+        self.camera = camera
+        self.prefilter = ScenePrefilter()
+        self.prev_area = None
+        self.roi = RoiMask()
+
+    def reset(self):
+        self.prefilter.reset()
+        self.prev_area = None
+
+    def analyse(
+        self, area: np.ndarray, frame_shape: typing.Tuple[int, ...]
+    ) -> typing.Optional[Changes]:
+        """Changes of the area and bright spots (in pixels of frame),
+        None if the prefilter sees no changes.
+        """
+        prev_area, self.prev_area = self.prev_area, area.copy()
+        if self.prefilter.unchanged(area, self.roi):
+            # an object which stays is learned by the background
+            learn_background(area, self.camera, self.roi)
+            return None
+
+        result = detect_area_changes(prev_area, area, self.camera, self.roi)
+        if result is None:
+            return None
+
+        frame_h, frame_w = frame_shape[:2]
+        area_h, area_w = area.shape
+        spots = detect_spots(
+            area,
+            scale=(frame_h / area_h, frame_w / area_w),
+            analysed=self.roi.grid_mask(area_h, area_w)
+            if self.roi.regions else None
+        )
+        return (*result, spots)
+
+
+# analysis of cameras in this process
+analyses: typing.Dict[str, CameraAnalysis] = {}
+
+
+def analyse_slot(
+    slot: int,
+    camera: str,
+    regions: typing.List[Region],
+    roi_version: int,
+    reset: bool = False
+) -> typing.Tuple[typing.Optional[Changes], dict]:
+    """Analysis of the area of ring slot in the worker process of camera
+    (regions of view of the camera are taken from the server process),
+    returns changes and counters of the prefilter.
+    """
+    analysis = analyses.get(camera)
+    if analysis is None:
+        analysis = analyses[camera] = CameraAnalysis(camera)
+
+    if analysis.roi.version != roi_version:
+        analysis.roi.set(regions, roi_version)
+        reset = True
+
+    if reset:
+        analysis.reset()
+
+    ring = get_frame_ring()
+    return (
+        analysis.analyse(ring.areas[slot], ring.frames[slot].shape),
+        analysis.prefilter.stats(),
+    )
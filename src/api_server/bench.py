@@ -0,0 +1,132 @@
+# run: python -m api_server.bench
+import timeit
+
+import numpy as np
+from PIL.Image import fromarray
+from PIL.ImageFilter import BoxBlur
+
+from .detection import detect_changes
+from .detection import get_detector
+from .pyramid import IMG_ANALYSIS_SCALE
+from .pyramid import get_pyramid
+from .spots import detect_spots
+
+
+def compare_areas_loop(source_area: np.ndarray, new_area: np.ndarray) -> int:
+    """The previous implementation of compare_areas (tiles in Python loop).
+    """
+    w, h = source_area.shape
+    m = 12
+    part_w = w // m
+    part_h = h // m
+    diff = source_area - new_area
+    std = []
+    for i in range(m):
+        for j in range(m):
+            part = diff[
+                i * part_w:(i + 1) * part_w,
+                j * part_h:(j + 1) * part_h
+            ]
+            std.append(part.std())
+
+    over = sum(1 if x < 0.014 else 0 for x in std)
+    return round(over / len(std) * 100)
+
+
+def bench_compare_areas(number: int = 20):
+    """Tile change detection: loop by tiles with float64 and
+    reshape-based pass with float32 and uint8.
+    """
+    rnd = np.random.default_rng(1)
+    for w, h in ((640, 480), (1280, 720)):
+        source = rnd.integers(0, 256, (h, w), dtype="u1")
+        new = source.copy()
+        new[h // 3:h // 2, w // 3:w // 2] = 255
+        source_f8 = source / 255
+        new_f8 = new / 255
+        source_f4 = source_f8.astype("f4")
+        new_f4 = new_f8.astype("f4")
+        assert compare_areas_loop(source_f8, new_f8) == detect_changes(
+            source_f4, new_f4
+        )[0] == detect_changes(source, new)[0]
+
+        cases = (
+            ("loop float64", compare_areas_loop, source_f8, new_f8),
+            ("vector float32", detect_changes, source_f4, new_f4),
+            ("vector uint8", detect_changes, source, new),
+        )
+        base = None
+        for name, method, a, b in cases:
+            sec = timeit.timeit(lambda: method(a, b), number=number) / number
+            base = base or sec
+            print(
+                f"{w}x{h} {name:>16}: {sec * 1000:8.3f} ms "
+                f"x{base / sec:0.1f}"
+            )
+
+
+def area_blur(frame: np.ndarray) -> np.ndarray:
+    """The previous area for analysis: full size blur and float64.
+    """
+    img_filter = BoxBlur(frame.shape[1] // 100)
+    arr = np.asarray(fromarray(frame).filter(img_filter)) / 255
+    return np.mean(arr, axis=2)
+
+
+def area_pyramid(frame: np.ndarray) -> np.ndarray:
+    h, w, _ = frame.shape
+    return get_pyramid(h, w).update(frame)[IMG_ANALYSIS_SCALE].copy()
+
+
+def bench_frame_analysis(number: int = 20):
+    """Area of frame and detection: full size blur with float64 and
+    downscaled level of pyramid with float32.
+    """
+    rnd = np.random.default_rng(1)
+    for w, h in ((640, 480), (1280, 720)):
+        source = rnd.integers(0, 256, (h, w, 3), dtype="u1")
+        new = source.copy()
+        new[h // 3:h // 2, w // 3:w // 2] = 255
+
+        def blur_case():
+            return detect_changes(area_blur(source), area_blur(new))[0]
+
+        def pyramid_case():
+            a = area_pyramid(source)
+            return get_detector(a.shape).detect(a, area_pyramid(new))[0]
+
+        base = None
+        for name, method in (
+            ("blur float64", blur_case), ("pyramid float32", pyramid_case)
+        ):
+            sec = timeit.timeit(method, number=number) / number
+            base = base or sec
+            print(
+                f"{w}x{h} {name:>16}: {sec * 1000:8.3f} ms "
+                f"x{base / sec:0.1f} ({method()}%)"
+            )
+
+
+def bench_spots(number: int = 20):
+    """Light spots on the analysed area (1/4 of frame): a few spots
+    and the worst case of noise with many small spots.
+    """
+    rnd = np.random.default_rng(1)
+    for w, h in ((160, 120), (320, 180)):
+        few = rnd.random((h, w), dtype="f4") * 0.8
+        few[h // 4:h // 3, w // 4:w // 3] = 0.95
+        few[h // 2:h // 2 + 3, w // 2:w // 2 + 3] = 0.9
+        noise = rnd.random((h, w), dtype="f4")
+        for name, area, limit in (
+            ("few spots", few, 0.85), ("noise", noise, 0.5)
+        ):
+            sec = timeit.timeit(
+                lambda: detect_spots(area, limit), number=number
+            ) / number
+            print(f"{w}x{h} {name:>16}: {sec * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    bench_compare_areas()
+    bench_frame_analysis()
+    bench_spots()
@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import os
+import typing
+import uuid
+from collections import OrderedDict
+
+from .helpers import env_var_line
+
+logger = logging.getLogger(env_var_line("LOGGER") or "uvicorn.asgi")
+# id of this process for the keys with counters of process,
+# their entity tags are not repeated after restart
+BOOT_ID = uuid.uuid4().hex[:12]
+
+
+def make_etag(key: str) -> str:
+    """Entity tag for HTTP headers.
+    """
+    return '"{}"'.format(hashlib.sha1(key.encode()).hexdigest()[:24])
+
+
+class BytesCache:
+    """LRU cache of encoded data in memory with limit of size in bytes.
+    Each entry has an entity tag for HTTP headers.
+    """
+    max_size: int
+    size: int
+    items: typing.Dict[str, typing.Tuple[str, bytes]]
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.items = OrderedDict()
+
+    def get(self, key: str) -> typing.Optional[typing.Tuple[str, bytes]]:
+        """Entity tag and data.
+        """
+        item = self.items.get(key)
+        if item is not None:
+            self.items.move_to_end(key)
+
+        return item
+
+    def set(self, key: str, data: bytes) -> str:
+        """Add data, returns entity tag.
+        """
+        etag = make_etag(key)
+        self.pop(key)
+        self.items[key] = (etag, data)
+        self.size += len(data)
+        while self.size > self.max_size and len(self.items) > 1:
+            _, (_, old_data) = self.items.popitem(last=False)
+            self.size -= len(old_data)
+
+        return etag
+
+    def pop(self, key: str):
+        item = self.items.pop(key, None)
+        if item is not None:
+            self.size -= len(item[1])
+
+
+class ChartCache(BytesCache):
+    """Rendered charts in memory and persistent charts on disk
+    (also with limit of size, old files are removed first).
+    """
+    path: str
+    max_disk_size: int
+
+    def __init__(self, path: str, max_size: int, max_disk_size: int):
+        super().__init__(max_size)
+        self.path = path
+        self.max_disk_size = max_disk_size
+
+    def filepath(self, key: str) -> str:
+        return os.path.join(
+            self.path, hashlib.sha1(key.encode()).hexdigest()
+        )
+
+    def get(self, key: str) -> typing.Optional[typing.Tuple[str, bytes]]:
+        """Entity tag and data from memory or disk.
+        """
+        item = super().get(key)
+        if item is None:
+            filepath = self.filepath(key)
+            try:
+                with open(filepath, "rb") as src:
+                    data = src.read()
+            except FileNotFoundError:
+                return None
+            except Exception as err:
+                logger.error(f"Chart cache file '{filepath}' error: {err}")
+                return None
+
+            os.utime(filepath)
+            item = self.set(key, data), data
+
+        return item
+
+    def save(self, key: str, data: bytes) -> str:
+        """Add data which will be kept on disk, returns entity tag.
+        """
+        etag = self.set(key, data)
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            filepath = self.filepath(key)
+            with open(f"{filepath}.tmp", "wb") as out:
+                out.write(data)
+
+            os.replace(f"{filepath}.tmp", filepath)
+            self.clear_disk()
+        except Exception as err:
+            logger.error(f"Chart cache save error: {err}")
+
+        return etag
+
+    def clear_disk(self):
+        """Remove the files which were not used for a long time.
+        """
+        files = sorted(
+            (
+                os.path.join(self.path, name)
+                for name in os.listdir(self.path)
+                if not name.endswith(".tmp")
+            ),
+            key=os.path.getmtime
+        )
+        size = sum(map(os.path.getsize, files))
+        while files and size > self.max_disk_size:
+            old_filepath, *files = files
+            size -= os.path.getsize(old_filepath)
+            os.remove(old_filepath)
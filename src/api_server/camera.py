@@ -0,0 +1,244 @@
+import abc
+import glob
+import os
+import re
+import subprocess
+import typing
+import uuid
+
+import numpy as np
+from PIL.Image import open as img_open
+
+from .helpers import env_var_line
+from .helpers import env_var_list
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+DEVICE = env_var_line("WEBCAM_DEVICE") or "video0"
+RESOLUTION = env_var_line("WEBCAM_RESOLUTION") or "640x480"
+# devices of cameras (the first one is the main camera) with optional
+# resolution of each one: video0:640x480,video1:1280x720
+WEBCAM_DEVICES = env_var_list("WEBCAM_DEVICES", str) or [DEVICE]
+device_rx = re.compile(r"^(.+?)(?::([0-9]+x[0-9]+))?$")
+# v4l2 (opencv is required), fswebcam, synthetic, replay
+CAMERA_SOURCE = env_var_line("CAMERA_SOURCE") or (
+    "v4l2" if cv2 else "fswebcam"
+)
+# directory with images (png, jpeg) for the replay source
+CAMERA_REPLAY_PATH = env_var_line("CAMERA_REPLAY_PATH") or "/tmp/replay"
+
+Frame = typing.Tuple[typing.Optional[np.ndarray], typing.List[str]]
+
+
+def parse_device(
+    line: str, resolution: str = RESOLUTION
+) -> typing.Tuple[str, str]:
+    """Device and resolution from "device[:WxH]".
+    """
+    device, device_resolution = device_rx.match(line.strip()).groups()
+    return device, device_resolution or resolution
+
+
+def device_path(device: str) -> str:
+    """Path of device file by its name in /dev or by path.
+    """
+    return device if os.path.isabs(device) else os.path.join("/dev", device)
+
+
+def camera_name(device: str) -> str:
+    """Name of camera by device for URLs and files.
+    """
+    name = os.path.basename(os.path.normpath(device))
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name).strip(".") or "camera"
+
+
+class FrameSource(abc.ABC):
+    """Source of camera frames as RGB uint8 arrays (height, width, 3)
+    with the messages of capture.
+    """
+    device: str
+    # path of device file
+    path: str
+    width: int
+    height: int
+
+    def __init__(self, device: str = DEVICE, resolution: str = RESOLUTION):
+        self.device = device
+        self.path = device_path(device)
+        self.width, self.height = map(int, resolution.split("x"))
+
+    @abc.abstractmethod
+    def read(self) -> Frame:
+        """The next frame.
+        """
+
+    def close(self):
+        pass
+
+
+class V4L2FrameSource(FrameSource):
+    """Camera device is opened once and kept open between frames.
+    """
+    capture: typing.Any
+
+    def __init__(self, device: str = DEVICE, resolution: str = RESOLUTION):
+        super().__init__(device, resolution)
+        self.capture = None
+
+    def open(self) -> bool:
+        self.capture = cv2.VideoCapture(self.path, cv2.CAP_V4L2)
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        # the last frame only, without the queue of old frames
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return self.capture.isOpened()
+
+    def read(self) -> Frame:
+        if self.capture is None:
+            if not self.open():
+                self.close()
+                return None, [f"Device {self.path} is not available"]
+        else:
+            # the device streams all the time, the buffer keeps the frame
+            # queued after the previous read (one capture interval old)
+            self.capture.grab()
+
+        done, frame = self.capture.read()
+        if not done:
+            # reopen with the next frame
+            self.close()
+            return None, [f"Frame reading error of {self.path}"]
+
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), []
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class FswebcamFrameSource(FrameSource):
+    """A process of fswebcam for each frame.
+    apt-get install fswebcam
+    """
+
+    def read(self, png_factor: int = 0) -> Frame:
+        img_path = f"/tmp/{uuid.uuid4().hex}.png"
+        result = subprocess.run(
+            [
+                "/usr/bin/fswebcam",
+                "-r",
+                f"{self.width}x{self.height}",
+                "--no-banner",
+                "--device",
+                self.path,
+                "--png",
+                f"{png_factor}",
+                img_path,
+            ],
+            capture_output=True,
+            text=True
+        )
+        lines = result.stdout.split("\n")
+        if os.path.exists(img_path):
+            with img_open(img_path) as image:
+                frame = np.asarray(image.convert("RGB"))
+
+            os.remove(img_path)
+        else:
+            frame = None
+
+        return frame, lines
+
+
+class SyntheticFrameSource(FrameSource):
+    """Generated frames: a gradient with a moving bright square.
+    """
+    index: int
+
+    def __init__(self, device: str = DEVICE, resolution: str = RESOLUTION):
+        super().__init__(device, resolution)
+        self.index = 0
+
+    def read(self) -> Frame:
+        h, w = self.height, self.width
+        row = np.linspace(0, 160, w, dtype="f4")
+        frame = np.empty((h, w, 3), dtype="u1")
+        frame[...] = row.astype("u1")[None, :, None]
+        size = max(min(h, w) // 8, 1)
+        x = (self.index * size) % max(w - size, 1)
+        frame[h // 2:h // 2 + size, x:x + size] = 255
+        self.index += 1
+        return frame, []
+
+
+class ReplayFrameSource(FrameSource):
+    """Images from directory in the loop (sorted by name).
+    """
+    files: typing.List[str]
+    index: int
+
+    def __init__(
+        self,
+        device: str = DEVICE,
+        resolution: str = RESOLUTION,
+        path: str = CAMERA_REPLAY_PATH
+    ):
+        super().__init__(device, resolution)
+        self.files = sorted(
+            filepath
+            for ext in ("png", "jpg", "jpeg")
+            for filepath in glob.glob(os.path.join(path, f"*.{ext}"))
+        )
+        self.index = 0
+
+    def read(self) -> Frame:
+        if not self.files:
+            return None, ["No images to replay"]
+
+        filepath = self.files[self.index % len(self.files)]
+        self.index += 1
+        with img_open(filepath) as image:
+            frame = np.asarray(image.convert("RGB"))
+
+        return frame, []
+
+
+FRAME_SOURCES = {
+    "v4l2": V4L2FrameSource,
+    "fswebcam": FswebcamFrameSource,
+    "synthetic": SyntheticFrameSource,
+    "replay": ReplayFrameSource,
+}
+# frame sources of this process by device
+frame_sources: typing.Dict[str, FrameSource] = {}
+
+
+def get_frame_source(
+    device: str = DEVICE, resolution: str = RESOLUTION
+) -> FrameSource:
+    """Frame source of the device in this process, it is kept
+    between captures.
+    """
+    source = frame_sources.get(device)
+    if source is None:
+        name = CAMERA_SOURCE
+        if name == "v4l2" and cv2 is None:
+            name = "fswebcam"
+
+        source = frame_sources[device] = FRAME_SOURCES[name](
+            device, resolution
+        )
+
+    return source
+
+
+def capture_frame(
+    device: str = DEVICE, resolution: str = RESOLUTION
+) -> Frame:
+    """Get frame from web camera.
+    """
+    return get_frame_source(device, resolution).read()
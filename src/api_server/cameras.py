@@ -0,0 +1,123 @@
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .camera import RESOLUTION
+from .camera import WEBCAM_DEVICES
+from .camera import camera_name
+from .camera import parse_device
+from .capture_scheduler import CAMERA_CPU_BUDGET
+from .capture_scheduler import CaptureScheduler
+from .clips import ClipRecorder
+from .frame_hub import FrameHub
+from .frame_ring import FRAME_RING_SLOTS
+from .frame_ring import FrameRing
+from .frame_ring import attach_frame_ring
+from .img import PATH_ACTUAL_IMG
+from .pyramid import IMG_ANALYSIS_SCALE
+from .roi import IMG_ROI_PATH
+from .roi import RoiMask
+
+
+class Camera:
+    """One camera device: the worker process which keeps the device
+    open, writes frames to its own ring and analyses them (the detection
+    state is kept there), so cameras are captured and analysed
+    in parallel. Cadence of capture, detection state and events
+    are separate for each camera.
+    """
+    # name for URLs and files
+    name: str
+    device: str
+    ring: FrameRing
+    executor: ProcessPoolExecutor
+    hub: FrameHub
+    scheduler: CaptureScheduler
+    # counters of the prefilter from the worker process
+    prefilter: dict
+    # regions of view (a copy is kept by the worker process)
+    roi: RoiMask
+    clip_recorder: ClipRecorder
+    # the last analysed area is saved to the file
+    area_path: str
+    last_image: typing.Optional[np.ndarray]
+    last_image_version: int
+    events: typing.List[tuple]
+    spots: typing.Optional[dict]
+
+    def __init__(
+        self,
+        name: str,
+        device: str,
+        resolution: str = RESOLUTION,
+        budget: float = CAMERA_CPU_BUDGET,
+        area_path: str = PATH_ACTUAL_IMG,
+        roi_path: str = IMG_ROI_PATH
+    ):
+        self.name = name
+        self.device = device
+        width, height = map(int, resolution.split("x"))
+        self.ring = FrameRing(
+            FRAME_RING_SLOTS, height, width, IMG_ANALYSIS_SCALE
+        )
+        self.executor = ProcessPoolExecutor(
+            max_workers=1,
+            initializer=attach_frame_ring,
+            initargs=self.ring.options
+        )
+        self.hub = FrameHub(self.executor, self.ring, device)
+        self.scheduler = CaptureScheduler(budget=budget)
+        self.prefilter = {}
+        self.roi = RoiMask(roi_path)
+        self.clip_recorder = ClipRecorder()
+        self.area_path = area_path
+        self.last_image = None
+        self.last_image_version = 0
+        self.events = []
+        self.spots = None
+
+    def close(self):
+        """Stop the worker process and remove the frame ring.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.hub.frame = self.hub.area = self.last_image = None
+        self.ring.close(unlink=True)
+
+
+def camera_path(path: str, name: str, index: int) -> str:
+    """File of the camera (the last analysed area, regions of view),
+    the main camera keeps the common path.
+    """
+    if not index:
+        return path
+
+    root, ext = os.path.splitext(path)
+    return f"{root}-{name}{ext}"
+
+
+def create_cameras(
+    devices: typing.List[str] = WEBCAM_DEVICES,
+    budget: float = CAMERA_CPU_BUDGET
+) -> typing.Dict[str, Camera]:
+    """Cameras by name (of device) with the resolution of each device,
+    the budget of processor time is divided between them.
+    """
+    devices = {
+        camera_name(device): (device, resolution)
+        for device, resolution in map(parse_device, devices)
+    }
+    return {
+        name: Camera(
+            name,
+            device,
+            resolution,
+            budget / len(devices),
+            camera_path(PATH_ACTUAL_IMG, name, index),
+            camera_path(IMG_ROI_PATH, name, index)
+        )
+        for index, (name, (device, resolution)) in enumerate(
+            devices.items()
+        )
+    }
@@ -0,0 +1,104 @@
+import typing
+
+from .helpers import current_time
+from .helpers import env_var_float
+from .helpers import env_var_int
+
+# seconds between frames in usual mode
+CAMERA_CHECK_INTERVAL = env_var_int("CAMERA_CHECK_INTERVAL") or 5
+# the longest interval after inactivity
+CAMERA_IDLE_INTERVAL = env_var_int("CAMERA_IDLE_INTERVAL") or 30
+# time without changes before the interval is increased
+CAMERA_IDLE_TIME = env_var_int("CAMERA_IDLE_TIME") or 600
+# the high rate for some time after a detected change
+CAMERA_BURST_INTERVAL = env_var_float("CAMERA_BURST_INTERVAL") or 1
+CAMERA_BURST_TIME = env_var_int("CAMERA_BURST_TIME") or 30
+# part of time which capture and analysis can take (of one core)
+CAMERA_CPU_BUDGET = env_var_float("CAMERA_CPU_BUDGET") or 0.25
+
+
+class CaptureScheduler:
+    """Interval of the capture loop by activity of scene:
+    the base interval, the burst after a change and the gradual
+    backoff (doubled up to idle interval) after inactivity.
+    Any interval is not shorter than the cost of capture
+    divided by budget.
+    """
+    base: float
+    idle: float
+    idle_time: float
+    burst: float
+    burst_time: float
+    budget: float
+    mode: str
+    current: float
+    delay: float
+    cost: float
+    rate: float
+    last_change: float
+    last_capture: float
+
+    def __init__(
+        self,
+        base: float = CAMERA_CHECK_INTERVAL,
+        idle: float = CAMERA_IDLE_INTERVAL,
+        idle_time: float = CAMERA_IDLE_TIME,
+        burst: float = CAMERA_BURST_INTERVAL,
+        burst_time: float = CAMERA_BURST_TIME,
+        budget: float = CAMERA_CPU_BUDGET
+    ):
+        self.base = base
+        self.idle = max(idle, base)
+        self.idle_time = idle_time
+        self.burst = min(burst, base)
+        self.burst_time = burst_time
+        self.budget = budget
+        self.mode = "base"
+        self.current = base
+        self.delay = base
+        self.cost = 0
+        self.rate = 0
+        self.last_change = current_time() - burst_time
+        self.last_capture = 0
+
+    def update(self, changed: bool, cost: float):
+        """Result of the capture: scene is changed and
+        time of capture with analysis in seconds.
+        """
+        now = current_time()
+        if self.last_capture:
+            period = now - self.last_capture
+            # exponential moving average of frames per second
+            self.rate = 0.8 * self.rate + 0.2 / period if self.rate else (
+                1 / period
+            )
+
+        self.last_capture = now
+        self.cost = 0.8 * self.cost + 0.2 * cost if self.cost else cost
+        if changed:
+            self.last_change = now
+
+    def interval(self) -> float:
+        """Seconds to the next capture.
+        """
+        inactive = current_time() - self.last_change
+        if inactive < self.burst_time:
+            self.mode = "burst"
+            self.current = self.burst
+        elif inactive < self.idle_time:
+            self.mode = "base"
+            self.current = self.base
+        else:
+            self.mode = "idle"
+            self.current = min(max(self.current, self.base) * 2, self.idle)
+
+        self.delay = max(self.current, self.cost / self.budget - self.cost)
+        return self.delay
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "mode": self.mode,
+            "interval": round(self.delay, 2),
+            "rate": round(self.rate, 3),
+            "cost": round(self.cost, 3),
+        }
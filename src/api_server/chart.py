@@ -0,0 +1,88 @@
+import io
+import typing
+
+import matplotlib.dates as mdates
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL.Image import frombuffer
+
+# format: PIL format name and mime-type
+CHART_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+class ChartRenderer:
+    """Line charts on the Agg canvas without pyplot,
+    one figure is reused for all charts of the process.
+    """
+    figure: Figure
+    canvas: FigureCanvasAgg
+    ax: Axes
+
+    def __init__(self):
+        self.figure = Figure()
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+
+    def render(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+        title: str = "",
+        size: typing.Tuple[int, int] = (640, 480),
+        dpi: int = 100,
+        img_format: str = "jpeg",
+        quality: int = 85
+    ) -> bytes:
+        """Chart of values y by datetime x as encoded image.
+        """
+        w, h = size
+        self.figure.set_dpi(dpi)
+        self.figure.set_size_inches(w / dpi, h / dpi)
+        ax = self.ax
+        ax.clear()
+        ax.plot(x, y)
+        ax.set_title(title)
+        ax.grid(True)
+        ax.xaxis.set_major_formatter(
+            mdates.ConciseDateFormatter(ax.xaxis.get_major_locator())
+        )
+        self.canvas.draw()
+        width, height = map(int, self.canvas.get_width_height())
+        img = frombuffer(
+            "RGBA", (width, height), self.canvas.buffer_rgba(), "raw",
+            "RGBA", 0, 1
+        ).convert("RGB")
+        pil_format, _ = CHART_FORMATS[img_format]
+        with io.BytesIO() as buffer:
+            img.save(buffer, pil_format, quality=quality)
+            result = buffer.getvalue()
+
+        ax.clear()
+        return result
+
+
+renderer: typing.Optional[ChartRenderer] = None
+
+
+def get_renderer() -> ChartRenderer:
+    """Renderer of this process.
+    """
+    global renderer
+    if renderer is None:
+        renderer = ChartRenderer()
+
+    return renderer
+
+
+def prewarm_renderer():
+    """Initializer of the worker processes:
+    the first chart pays for fonts and backend loading.
+    """
+    x = np.arange("2020-01-01", "2020-01-03", dtype="datetime64[h]")
+    get_renderer().render(x, np.zeros(len(x)), size=(100, 100))
@@ -0,0 +1,252 @@
+import io
+import json
+import os
+import re
+import typing
+from datetime import datetime
+
+import numpy as np
+from PIL.Image import fromarray
+
+from .helpers import env_var_int
+from .helpers import env_var_line
+
+CLIP_PATH = env_var_line("CLIP_PATH") or "/data/camera/clips"
+# frames before event and after event
+CLIP_PRE_FRAMES = env_var_int("CLIP_PRE_FRAMES") or 5
+CLIP_POST_FRAMES = env_var_int("CLIP_POST_FRAMES") or 10
+# the longest clip (events extend recording)
+CLIP_MAX_FRAMES = env_var_int("CLIP_MAX_FRAMES") or 100
+# frames of clip are downscaled by the factor
+CLIP_SCALE = env_var_int("CLIP_SCALE") or 2
+CLIP_QUALITY = env_var_int("CLIP_QUALITY") or 70
+# in mb
+CLIP_STORAGE_MAX_SIZE = env_var_int("CLIP_STORAGE_MAX_SIZE") or 200
+CLIP_EXT = "mjpeg"
+clip_name_rx = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9]+$")
+
+
+class ClipFrameBuffer:
+    """The last frames (downscaled by stride) and their time
+    in preallocated array.
+    """
+    size: int
+    scale: int
+    frames: typing.Optional[np.ndarray]
+    dts: typing.List[typing.Optional[datetime]]
+    count: int
+
+    def __init__(self, size: int = CLIP_PRE_FRAMES, scale: int = CLIP_SCALE):
+        self.size = size
+        self.scale = scale
+        self.frames = None
+        self.dts = [None] * size
+        self.count = 0
+
+    def push(self, frame: np.ndarray, dt: datetime) -> np.ndarray:
+        """Add frame, returns its downscaled copy in the buffer.
+        """
+        small = frame[::self.scale, ::self.scale]
+        if self.frames is None or self.frames.shape[1:] != small.shape:
+            self.frames = np.empty((self.size, *small.shape), dtype="u1")
+            self.count = 0
+
+        index = self.count % self.size
+        self.frames[index] = small
+        self.dts[index] = dt
+        self.count += 1
+        return self.frames[index]
+
+    def items(self) -> typing.List[typing.Tuple[np.ndarray, datetime]]:
+        """Copies of frames in order of time.
+        """
+        n = min(self.count, self.size)
+        return [
+            (self.frames[i % self.size].copy(), self.dts[i % self.size])
+            for i in range(self.count - n, self.count)
+        ]
+
+
+class ClipRecorder:
+    """Frames before event (from buffer) and after event are collected
+    to clip, a new event during recording extends the clip.
+    """
+    buffer: ClipFrameBuffer
+    post_frames: int
+    max_frames: int
+    name: typing.Optional[str]
+    frames: typing.List[typing.Tuple[np.ndarray, datetime]]
+    left: int
+
+    def __init__(
+        self,
+        pre_frames: int = CLIP_PRE_FRAMES,
+        post_frames: int = CLIP_POST_FRAMES,
+        scale: int = CLIP_SCALE,
+        max_frames: int = CLIP_MAX_FRAMES
+    ):
+        self.buffer = ClipFrameBuffer(pre_frames, scale)
+        self.post_frames = post_frames
+        self.max_frames = max_frames
+        self.name = None
+        self.frames = []
+        self.left = 0
+
+    @property
+    def recording(self) -> bool:
+        return self.name is not None
+
+    def trigger(self, event_id: int, dt: datetime):
+        """Event: the clip is started with the frames of buffer
+        (the current frame is already there).
+        """
+        if self.name is None:
+            self.name = f"{dt:%Y%m%d-%H%M%S}-{event_id}"
+            self.frames = self.buffer.items()
+
+        self.left = self.post_frames
+
+    def push(
+        self, frame: np.ndarray, dt: datetime
+    ) -> typing.Optional[
+        typing.Tuple[str, typing.List[typing.Tuple[np.ndarray, datetime]]]
+    ]:
+        """Add frame, returns name and frames of the finished clip.
+        """
+        small = self.buffer.push(frame, dt)
+        if self.name is None:
+            return None
+
+        if self.left <= 0 or len(self.frames) >= self.max_frames:
+            return self.finish()
+
+        self.frames.append((small.copy(), dt))
+        self.left -= 1
+        return None
+
+    def finish(
+        self
+    ) -> typing.Optional[
+        typing.Tuple[str, typing.List[typing.Tuple[np.ndarray, datetime]]]
+    ]:
+        if self.name is None:
+            return None
+
+        result = self.name, self.frames
+        self.name = None
+        self.frames = []
+        self.left = 0
+        return result
+
+
+def clip_filepath(name: str, path: str = CLIP_PATH) -> str:
+    return os.path.join(path, f"{name}.{CLIP_EXT}")
+
+
+def index_filepath(name: str, path: str = CLIP_PATH) -> str:
+    return os.path.join(path, f"{name}.json")
+
+
+def write_clip(
+    name: str,
+    frames: typing.List[typing.Tuple[np.ndarray, datetime]],
+    quality: int = CLIP_QUALITY,
+    path: str = CLIP_PATH,
+    max_size: int = CLIP_STORAGE_MAX_SIZE * 1024 ** 2,
+    camera: str = ""
+) -> dict:
+    """Clip file of concatenated JPEG frames with index of offsets
+    in the json file, old clips are removed by limit of size.
+    """
+    os.makedirs(path, exist_ok=True)
+    filepath = clip_filepath(name, path)
+    index = []
+    offset = 0
+    with open(f"{filepath}.tmp", "wb") as out:
+        for frame, dt in frames:
+            with io.BytesIO() as buffer:
+                fromarray(frame).save(buffer, "JPEG", quality=quality)
+                data = buffer.getvalue()
+
+            out.write(data)
+            index.append({
+                "dt": dt.isoformat(), "offset": offset, "size": len(data)
+            })
+            offset += len(data)
+
+    h, w = frames[0][0].shape[:2] if frames else (0, 0)
+    info = {
+        "name": name,
+        "camera": camera,
+        "size": offset,
+        "width": w,
+        "height": h,
+        "frames": index,
+    }
+    with open(f"{index_filepath(name, path)}.tmp", "w") as out:
+        json.dump(info, out)
+
+    os.replace(f"{filepath}.tmp", filepath)
+    index_path = index_filepath(name, path)
+    os.replace(f"{index_path}.tmp", index_path)
+    clear_clips(path, max_size)
+    return info
+
+
+def clip_names(path: str = CLIP_PATH) -> typing.List[str]:
+    """Names of clips, the old ones first.
+    """
+    try:
+        files = os.listdir(path)
+    except FileNotFoundError:
+        return []
+
+    return sorted(
+        (
+            name
+            for name, ext in map(os.path.splitext, files)
+            if ext == f".{CLIP_EXT}" and clip_name_rx.match(name)
+        ),
+        key=lambda name: (name[:15], int(name[16:]))
+    )
+
+
+def clear_clips(path: str = CLIP_PATH, max_size: int = 0) -> int:
+    """Remove the old clips while the size of storage is over limit,
+    returns number of removed clips.
+    """
+    names = clip_names(path)
+    sizes = [
+        os.path.getsize(clip_filepath(name, path)) for name in names
+    ]
+    total = sum(sizes)
+    n = 0
+    for name, size in zip(names, sizes):
+        if total <= max_size:
+            break
+
+        for filepath in (
+            clip_filepath(name, path), index_filepath(name, path)
+        ):
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+        total -= size
+        n += 1
+
+    return n
+
+
+def read_clip_index(name: str, path: str = CLIP_PATH) -> dict:
+    with open(index_filepath(name, path)) as src:
+        return json.load(src)
+
+
+def read_clip_range(
+    name: str, begin: int, end: int, path: str = CLIP_PATH
+) -> bytes:
+    """Bytes [begin..end) of clip file.
+    """
+    with open(clip_filepath(name, path), "rb") as src:
+        src.seek(begin)
+        return src.read(max(end - begin, 0))
@@ -0,0 +1,478 @@
+import typing
+
+import numpy as np
+
+from .helpers import env_var_float
+from .helpers import env_var_int
+from .helpers import env_var_line
+from .roi import RoiMask
+from .roi import roi_mask
+
+# grid of tiles (grid x grid)
+IMG_COMPARE_GRID = env_var_int("IMG_COMPARE_GRID") or 12
+# standard deviation of tile difference (for values in [0..1])
+# which is still similar
+IMG_TILE_STD_LIMIT = env_var_float("IMG_TILE_STD_LIMIT") or 0.014
+# thumbnail of prefilter (size x size blocks) and
+# maximum difference of block means (for values in [0..1])
+IMG_PREFILTER_SIZE = env_var_int("IMG_PREFILTER_SIZE") or 16
+IMG_PREFILTER_LIMIT = env_var_float("IMG_PREFILTER_LIMIT") or 0.01
+# "background" (model of scene) or "frame" (the previous frame)
+IMG_DETECTION_MODE = env_var_line("IMG_DETECTION_MODE") or "background"
+# update rate of background and the rate for changed pixels
+IMG_BG_RATE = env_var_float("IMG_BG_RATE") or 0.05
+IMG_BG_FOREGROUND_RATE = env_var_float("IMG_BG_FOREGROUND_RATE") or 0.005
+# pixel is changed if it differs more than deviations
+IMG_BG_DEVIATIONS = env_var_float("IMG_BG_DEVIATIONS") or 4
+# the least standard deviation of pixel (for values in [0..1])
+IMG_BG_MIN_STD = env_var_float("IMG_BG_MIN_STD") or 0.02
+# tile is changed if the part of its pixels are changed
+IMG_BG_TILE_LIMIT = env_var_float("IMG_BG_TILE_LIMIT") or 0.05
+
+
+def value_scale(area: np.ndarray) -> float:
+    """Maximum of the values: 255 for integer images, 1 for float.
+    """
+    return 255 if np.issubdtype(area.dtype, np.integer) else 1
+
+
+def tile_size(
+    shape: typing.Tuple[int, int], grid: int
+) -> typing.Tuple[int, int]:
+    """Height and width of tile of grid x grid, tile is one pixel
+    at least.
+    """
+    h, w = shape
+    if not 0 < grid <= min(h, w):
+        raise ValueError(f"Wrong grid {grid} of area {w}x{h}")
+
+    return h // grid, w // grid
+
+
+def tile_std(diff: np.ndarray, grid: int = IMG_COMPARE_GRID) -> np.ndarray:
+    """Standard deviation of each tile as matrix grid x grid.
+    Tiles are views of reshaped array so all of them are computed
+    in one pass, the rest of rows and columns is ignored.
+    """
+    tile_h, tile_w = tile_size(diff.shape, grid)
+    tiles = diff[:tile_h * grid, :tile_w * grid].reshape(
+        grid, tile_h, grid, tile_w
+    )
+    n = tile_h * tile_w
+    if np.issubdtype(diff.dtype, np.integer):
+        total = tiles.sum(axis=(1, 3), dtype="i8")
+        squares = np.square(tiles, dtype="i4").sum(axis=(1, 3), dtype="i8")
+        var = (squares * n - total * total) / float(n * n)
+    else:
+        mean = tiles.mean(axis=(1, 3), dtype="f8")
+        squares = np.square(tiles).mean(axis=(1, 3), dtype="f8")
+        var = squares - mean * mean
+
+    return np.sqrt(np.maximum(var, 0)).astype("f4")
+
+
+def detect_changes(
+    source_area: np.ndarray,
+    new_area: np.ndarray,
+    grid: int = IMG_COMPARE_GRID,
+    limit: float = IMG_TILE_STD_LIMIT
+) -> typing.Tuple[int, np.ndarray]:
+    """The probability of the images are similar in percents
+    and the deviation of each tile (scaled to [0..1]).
+    """
+    if source_area.shape != new_area.shape:
+        return 0, np.empty((0, 0), dtype="f4")
+
+    if np.issubdtype(new_area.dtype, np.integer):
+        diff = np.subtract(source_area, new_area, dtype="i2")
+    else:
+        diff = np.subtract(source_area, new_area, dtype="f4")
+
+    scores = tile_std(diff, grid)
+    scale = value_scale(new_area)
+    if scale != 1:
+        scores /= scale
+
+    over = np.count_nonzero(scores < limit)
+    return round(over / scores.size * 100), scores
+
+
+def changed_box(
+    scores: np.ndarray,
+    area_shape: typing.Tuple[int, int],
+    frame_shape: typing.Tuple[int, ...],
+    limit: float = IMG_TILE_STD_LIMIT
+) -> typing.Optional[typing.Tuple[int, int, int, int]]:
+    """Bounding box (left, top, right, bottom) of the changed tiles
+    in pixels of frame.
+    """
+    changed = scores >= limit
+    if not changed.any():
+        return None
+
+    rows = np.flatnonzero(changed.any(axis=1))
+    cols = np.flatnonzero(changed.any(axis=0))
+    grid_h, grid_w = scores.shape
+    h, w = area_shape
+    scale_y = frame_shape[0] / h * (h // grid_h)
+    scale_x = frame_shape[1] / w * (w // grid_w)
+    return (
+        int(cols[0] * scale_x),
+        int(rows[0] * scale_y),
+        int((cols[-1] + 1) * scale_x),
+        int((rows[-1] + 1) * scale_y),
+    )
+
+
+def tile_pixels(
+    shape: typing.Tuple[int, int], grid: int, tiles: np.ndarray
+) -> np.ndarray:
+    """Flat indexes of pixels of the tiles (tiles x pixels of tile),
+    the rest of rows and columns is ignored.
+    """
+    _, w = shape
+    tile_h, tile_w = tile_size(shape, grid)
+    rows, cols = np.divmod(tiles, grid)
+    offsets = (
+        np.arange(tile_h)[:, None] * w + np.arange(tile_w)[None, :]
+    ).reshape(-1)
+    starts = rows * tile_h * w + cols * tile_w
+    return (starts[:, None] + offsets[None, :]).astype("intp")
+
+
+def gather_tiles(area: np.ndarray, pixels: np.ndarray, out: np.ndarray):
+    """Pixels of the tiles of area to buffer (tiles x pixels of tile).
+    """
+    values = np.ascontiguousarray(area, dtype="f4").reshape(-1)
+    np.take(values, pixels, out=out, mode="clip")
+
+
+class ChangeDetector:
+    """Change detection of float32 areas of the same size. Only the
+    selected tiles (all by default) are gathered to the buffers which
+    are allocated once, the rest of tiles is never computed.
+    """
+    shape: typing.Tuple[int, int]
+    grid: int
+    limit: float
+    tiles: np.ndarray
+    pixels: np.ndarray
+    diff: np.ndarray
+    new: np.ndarray
+    squares: np.ndarray
+
+    def __init__(
+        self,
+        shape: typing.Tuple[int, int],
+        grid: int = IMG_COMPARE_GRID,
+        limit: float = IMG_TILE_STD_LIMIT,
+        tiles: typing.Optional[np.ndarray] = None
+    ):
+        self.shape = shape
+        self.grid = grid
+        self.limit = limit
+        if tiles is None:
+            tiles = np.arange(grid * grid)
+
+        self.tiles = np.asarray(tiles, dtype="intp")
+        self.pixels = tile_pixels(shape, grid, self.tiles)
+        self.diff = np.empty(self.pixels.shape, dtype="f4")
+        self.new = np.empty_like(self.diff)
+        self.squares = np.empty_like(self.diff)
+
+    def detect(
+        self, source_area: np.ndarray, new_area: np.ndarray
+    ) -> typing.Tuple[int, np.ndarray]:
+        """The same as detect_changes for the selected tiles,
+        the scores of the rest of tiles are zero.
+        """
+        if source_area.shape != self.shape or new_area.shape != self.shape:
+            return 0, np.empty((0, 0), dtype="f4")
+
+        scores = np.zeros((self.grid, self.grid), dtype="f4")
+        if not len(self.tiles):
+            return 100, scores
+
+        diff = self.diff
+        gather_tiles(source_area, self.pixels, diff)
+        gather_tiles(new_area, self.pixels, self.new)
+        diff -= self.new
+        np.square(diff, out=self.squares)
+        mean = diff.mean(axis=1, dtype="f8")
+        var = self.squares.mean(axis=1, dtype="f8") - mean * mean
+        tile_scores = np.sqrt(np.maximum(var, 0)) / value_scale(new_area)
+        scores.reshape(-1)[self.tiles] = tile_scores
+        over = np.count_nonzero(tile_scores < self.limit)
+        return round(over / len(self.tiles) * 100), scores
+
+
+# detectors of this process by shape and version of regions
+detectors: typing.Dict[tuple, ChangeDetector] = {}
+
+
+def get_detector(
+    shape: typing.Tuple[int, int], roi: RoiMask = roi_mask
+) -> ChangeDetector:
+    """Detector of this process for areas of the shape
+    (and the current regions of view of the camera).
+    """
+    key = (shape, id(roi), roi.version)
+    if key not in detectors:
+        detectors.clear()
+        detectors[key] = ChangeDetector(
+            shape, tiles=roi.tiles(IMG_COMPARE_GRID)
+        )
+
+    return detectors[key]
+
+
+class ScenePrefilter:
+    """The cheap first stage before change detection: thumbnail
+    (block means size x size) of area is compared with thumbnail of
+    the last area which was fully checked, the scene is not changed
+    if no block differs more than limit. So slow changes are summed
+    until the full detection.
+    """
+    size: int
+    limit: float
+    thumbnail: typing.Optional[np.ndarray]
+    buffer: typing.Optional[np.ndarray]
+    checked: int
+    skipped: int
+
+    def __init__(
+        self,
+        size: int = IMG_PREFILTER_SIZE,
+        limit: float = IMG_PREFILTER_LIMIT
+    ):
+        self.size = size
+        self.limit = limit
+        self.thumbnail = None
+        self.buffer = None
+        self.checked = 0
+        self.skipped = 0
+
+    def make_thumbnail(self, area: np.ndarray) -> np.ndarray:
+        h, w = area.shape
+        # the thumbnail isn't larger than the area
+        size = max(min(self.size, h, w), 1)
+        block_h = h // size
+        block_w = w // size
+        if self.buffer is None or self.buffer.shape != (size, size):
+            self.buffer = np.empty((size, size), dtype="f4")
+
+        area[:block_h * size, :block_w * size].reshape(
+            size, block_h, size, block_w
+        ).mean(axis=(1, 3), out=self.buffer)
+        return self.buffer
+
+    def unchanged(
+        self, area: np.ndarray, roi: typing.Optional[RoiMask] = None
+    ) -> bool:
+        """True if the area is clearly the same as the reference one,
+        the blocks of ignored regions (of roi) are not compared.
+        """
+        prev = self.thumbnail
+        new = self.make_thumbnail(area)
+        if prev is not None and prev.shape == new.shape:
+            self.checked += 1
+            diff = np.abs(prev - new)
+            if roi is not None and roi.regions:
+                diff = diff[roi.grid_mask(*diff.shape)]
+
+            diff = diff.max(initial=0) / value_scale(area)
+            if diff < self.limit:
+                self.skipped += 1
+                return True
+
+        # buffers are swapped: the new thumbnail is the reference
+        self.thumbnail, self.buffer = new, prev
+        return False
+
+    def reset(self):
+        self.thumbnail = None
+
+    def stats(self) -> dict:
+        return {
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skipped_ratio": round(
+                self.skipped / self.checked if self.checked else 0, 3
+            ),
+        }
+
+
+class BackgroundModel:
+    """Exponential running mean and variance of each pixel of area.
+    Pixel is changed if it differs from the mean more than deviations
+    (after the global shift of brightness is removed), score of tile is
+    the part of changed pixels. The changed pixels are learned slowly,
+    so a slow object is still visible. The model keeps only pixels of
+    the selected tiles (all by default), all buffers are allocated once.
+    """
+    shape: typing.Tuple[int, int]
+    grid: int
+    rate: float
+    foreground_rate: float
+    deviations: float
+    min_var: float
+    limit: float
+    ready: bool
+    tiles: np.ndarray
+    pixels: np.ndarray
+    values: np.ndarray
+    mean: np.ndarray
+    var: np.ndarray
+    diff: np.ndarray
+    squares: np.ndarray
+    tmp: np.ndarray
+    rates: np.ndarray
+    mask: np.ndarray
+    counts: np.ndarray
+    tile_scores: np.ndarray
+    scores: np.ndarray
+
+    def __init__(
+        self,
+        shape: typing.Tuple[int, int],
+        grid: int = IMG_COMPARE_GRID,
+        rate: float = IMG_BG_RATE,
+        foreground_rate: float = IMG_BG_FOREGROUND_RATE,
+        deviations: float = IMG_BG_DEVIATIONS,
+        min_std: float = IMG_BG_MIN_STD,
+        limit: float = IMG_BG_TILE_LIMIT,
+        tiles: typing.Optional[np.ndarray] = None
+    ):
+        self.shape = shape
+        self.grid = grid
+        self.rate = rate
+        self.foreground_rate = foreground_rate
+        self.deviations = deviations
+        self.min_var = min_std * min_std
+        self.limit = limit
+        self.ready = False
+        if tiles is None:
+            tiles = np.arange(grid * grid)
+
+        self.tiles = np.asarray(tiles, dtype="intp")
+        self.pixels = tile_pixels(shape, grid, self.tiles)
+        buffer_shape = self.pixels.shape
+        self.values = np.empty(buffer_shape, dtype="f4")
+        self.mean = np.zeros(buffer_shape, dtype="f4")
+        self.var = np.zeros(buffer_shape, dtype="f4")
+        self.diff = np.empty(buffer_shape, dtype="f4")
+        self.squares = np.empty(buffer_shape, dtype="f4")
+        self.tmp = np.empty(buffer_shape, dtype="f4")
+        self.rates = np.empty(buffer_shape, dtype="f4")
+        self.mask = np.empty(buffer_shape, dtype="?")
+        self.counts = np.empty(len(self.tiles), dtype="intp")
+        self.tile_scores = np.empty(len(self.tiles), dtype="f4")
+        self.scores = np.zeros((grid, grid), dtype="f4")
+
+    def reset(self):
+        self.ready = False
+
+    def update(self, area: np.ndarray):
+        """Learn the area without detection (the scene is not changed,
+        all pixels have the usual rate).
+        """
+        if area.shape != self.shape or not len(self.tiles):
+            return
+
+        values = self.values
+        gather_tiles(area, self.pixels, values)
+        if not self.ready:
+            self.mean[...] = values
+            self.var.fill(self.min_var)
+            self.ready = True
+            return
+
+        # mean += rate * diff, var = (1 - rate) * (var + rate * diff^2)
+        diff = self.diff
+        np.subtract(values, self.mean, out=diff)
+        np.multiply(diff, self.rate, out=self.tmp)
+        self.mean += self.tmp
+        np.square(diff, out=diff)
+        diff *= self.rate
+        diff += self.var
+        np.multiply(diff, 1 - self.rate, out=self.var)
+
+    def detect(self, area: np.ndarray) -> typing.Tuple[int, np.ndarray]:
+        """The probability of the area is similar to the background
+        in percents and the part of changed pixels of each tile
+        (the matrix is reused by the next call). The model is updated.
+        """
+        if area.shape != self.shape:
+            return 0, np.empty((0, 0), dtype="f4")
+
+        if not len(self.tiles):
+            return 100, self.scores
+
+        values = self.values
+        gather_tiles(area, self.pixels, values)
+        if not self.ready:
+            self.mean[...] = values
+            self.var.fill(self.min_var)
+            self.ready = True
+            return 100, self.scores
+
+        diff = self.diff
+        squares = self.squares
+        tmp = self.tmp
+        mask = self.mask
+        np.subtract(values, self.mean, out=diff)
+        # the global shift of brightness (median of difference)
+        # is not a change
+        np.copyto(squares, diff)
+        flat = squares.reshape(-1)
+        middle = flat.size // 2
+        flat.partition(middle)
+        np.subtract(diff, flat[middle], out=squares)
+        np.square(squares, out=squares)
+        np.maximum(self.var, self.min_var, out=tmp)
+        tmp *= self.deviations * self.deviations
+        np.greater(squares, tmp, out=mask)
+
+        mask.sum(axis=1, out=self.counts)
+        np.divide(self.counts, mask.shape[1], out=self.tile_scores)
+        self.scores.reshape(-1)[self.tiles] = self.tile_scores
+
+        # mean += rate * diff, var = (1 - rate) * (var + rate * diff^2)
+        # (the shift of brightness is learned by the mean)
+        rates = self.rates
+        rates.fill(self.rate)
+        np.putmask(rates, mask, self.foreground_rate)
+        np.multiply(rates, diff, out=tmp)
+        self.mean += tmp
+        np.multiply(rates, squares, out=tmp)
+        tmp += self.var
+        np.subtract(1, rates, out=rates)
+        np.multiply(tmp, rates, out=self.var)
+
+        over = np.count_nonzero(self.tile_scores < self.limit)
+        return round(over / len(self.tiles) * 100), self.scores
+
+
+# background models of this process by camera
+# (with shape and version of regions)
+background_models: typing.Dict[
+    str, typing.Tuple[tuple, BackgroundModel]
+] = {}
+
+
+def get_background_model(
+    shape: typing.Tuple[int, int],
+    camera: str = "",
+    roi: RoiMask = roi_mask
+) -> BackgroundModel:
+    """Background model of the camera in this process for areas
+    of the shape (and the current regions of view of the camera).
+    """
+    key = (shape, roi.version)
+    item = background_models.get(camera)
+    if item is None or item[0] != key:
+        item = background_models[camera] = key, BackgroundModel(
+            shape, tiles=roi.tiles(IMG_COMPARE_GRID)
+        )
+
+    return item[1]
@@ -0,0 +1,34 @@
+import typing
+
+import numpy as np
+
+
+def minmax_indexes(values: np.ndarray, max_points: int) -> np.ndarray:
+    """Indexes of points to draw a series with max_points at most:
+    the minimum and the maximum of each bucket (the spikes are kept).
+    All buckets are processed in one pass over reshaped array.
+    """
+    n = len(values)
+    if max_points <= 0 or n <= max_points:
+        return np.arange(n)
+
+    # two points of bucket and two edge points
+    buckets = max((max_points - 2) // 2, 1)
+    size = -(-n // buckets)
+    buckets = -(-n // size)
+    table = np.pad(values, (0, buckets * size - n), mode="edge")
+    table = table.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    # padding is copy of the last value, so index is limited by n - 1
+    mins = np.minimum(np.argmin(table, axis=1) + offsets, n - 1)
+    maxs = np.minimum(np.argmax(table, axis=1) + offsets, n - 1)
+    return np.unique(np.concatenate([[0], mins, maxs, [n - 1]]))
+
+
+def downsample(
+    ts: np.ndarray, values: np.ndarray, max_points: int
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Timestamps and values reduced to max_points.
+    """
+    index = minmax_indexes(values, max_points)
+    return ts[index], values[index]
@@ -0,0 +1,94 @@
+import asyncio
+import typing
+from collections import deque
+from concurrent.futures import Executor
+
+from .helpers import env_var_int
+
+# jobs of cameras which are running in the worker pool at once
+CAMERA_POOL_JOBS = env_var_int("CAMERA_POOL_JOBS") or 2
+
+
+class FairPool:
+    """Jobs of several sources (cameras) in the shared worker pool.
+    Each source has its own queue and the sources take turns
+    (round-robin), so a busy source doesn't delay jobs of the others.
+    Not more than limit jobs are running at once, the rest of the pool
+    is left for the other requests.
+    """
+    executor: Executor
+    limit: int
+    running: int
+    queues: typing.Dict[str, typing.Deque[tuple]]
+    order: typing.Deque[str]
+    done: typing.Dict[str, int]
+
+    def __init__(self, executor: Executor, limit: int = CAMERA_POOL_JOBS):
+        self.executor = executor
+        self.limit = max(limit, 1)
+        self.running = 0
+        self.queues = {}
+        self.order = deque()
+        self.done = {}
+
+    def run(
+        self, source: str, func: typing.Callable, *args
+    ) -> typing.Awaitable[typing.Any]:
+        """Result of the function in the pool, in turn of the source.
+        """
+        future = asyncio.get_running_loop().create_future()
+        queue = self.queues.get(source)
+        if queue is None:
+            queue = self.queues[source] = deque()
+            self.order.append(source)
+
+        queue.append((future, func, args))
+        self.dispatch()
+        return future
+
+    def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self.running < self.limit and self.order:
+            source = self.order.popleft()
+            queue = self.queues[source]
+            future, func, args = queue.popleft()
+            if queue:
+                # to the end of the turn
+                self.order.append(source)
+            else:
+                del self.queues[source]
+
+            if future.cancelled():
+                continue
+
+            self.running += 1
+            job = loop.run_in_executor(self.executor, func, *args)
+            job.add_done_callback(
+                lambda job, future=future, source=source: self.finish(
+                    source, future, job
+                )
+            )
+
+    def finish(
+        self, source: str, future: asyncio.Future, job: asyncio.Future
+    ):
+        self.running -= 1
+        self.done[source] = self.done.get(source, 0) + 1
+        if not future.done():
+            if job.cancelled():
+                future.cancel()
+            elif job.exception() is not None:
+                future.set_exception(job.exception())
+            else:
+                future.set_result(job.result())
+
+        self.dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": {
+                source: len(queue) for source, queue in self.queues.items()
+            },
+            "done": dict(self.done),
+        }
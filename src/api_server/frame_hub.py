@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import typing
+from concurrent.futures import Executor
+from datetime import datetime
+
+import numpy as np
+
+from .camera import DEVICE
+from .frame_ring import FrameRing
+from .helpers import current_datetime
+from .helpers import current_time
+from .helpers import env_var_line
+from .img import capture_photo_slot
+
+logger = logging.getLogger(env_var_line("LOGGER") or "uvicorn.asgi")
+
+
+class FrameHub:
+    """The latest frame of camera (and its analysed area) for all consumers.
+    Only one capture is running at a time, concurrent requests of
+    a fresh frame wait for the same capture.
+    Frames are written by the worker process to the slots of shared
+    ring in turn, a frame (and area) is valid until the ring comes
+    around to its slot again.
+    """
+    executor: Executor
+    ring: FrameRing
+    device: str
+    version: int
+    # slot of ring of the latest frame
+    slot: int
+    frame: typing.Optional[np.ndarray]
+    area: typing.Optional[np.ndarray]
+    messages: typing.List[str]
+    dt: typing.Optional[datetime]
+    updated: float
+    task: typing.Optional[asyncio.Task]
+
+    def __init__(
+        self, executor: Executor, ring: FrameRing, device: str = DEVICE
+    ):
+        self.executor = executor
+        self.ring = ring
+        self.device = device
+        self.version = 0
+        self.slot = 0
+        self.frame = None
+        self.area = None
+        self.messages = []
+        self.dt = None
+        self.updated = 0
+        self.task = None
+
+    @property
+    def age(self) -> float:
+        """Time since the last frame in seconds.
+        """
+        if self.frame is None:
+            return float("inf")
+
+        return current_time() - self.updated
+
+    async def run_capture(self) -> bool:
+        loop = asyncio.get_running_loop()
+        slot = (self.version + 1) % self.ring.slots
+        try:
+            done, messages = await loop.run_in_executor(
+                self.executor, capture_photo_slot, slot, self.device
+            )
+        except Exception as err:
+            logger.error(f"Photo getting error ({self.device}): {err}")
+            return False
+
+        self.messages = messages
+        if not done:
+            logger.warning(
+                "Photo getting problem (%s): %s",
+                self.device,
+                " ".join(messages)
+            )
+            return False
+
+        self.slot = slot
+        self.frame = self.ring.frames[slot]
+        self.area = self.ring.areas[slot]
+        self.dt = current_datetime()
+        self.updated = current_time()
+        self.version += 1
+        return True
+
+    def capture(self) -> typing.Awaitable[bool]:
+        """New frame, the running capture is shared.
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(
+                self.run_capture()
+            )
+
+        return asyncio.shield(self.task)
+
+    async def get(
+        self, max_age: typing.Optional[float] = None
+    ) -> typing.Optional[np.ndarray]:
+        """The latest frame, a new one is captured if the latest frame
+        is older than max_age seconds (or there is no frame).
+        None if the capture is failed, the old frame is too old.
+        """
+        if self.frame is None or (
+            max_age is not None and self.age > max_age
+        ):
+            if not await self.capture():
+                return None
+
+        return self.frame
@@ -0,0 +1,91 @@
+import typing
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .helpers import env_var_int
+
+FRAME_RING_SLOTS = env_var_int("FRAME_RING_SLOTS") or 4
+
+
+class FrameRing:
+    """Preallocated slots of frames (RGB uint8) and analysed areas
+    (float32, the frame downscaled by area_scale) in shared memory.
+    A worker process writes data in place and the event loop gets
+    only the slot index.
+    """
+    slots: int
+    height: int
+    width: int
+    area_scale: int
+    shm: SharedMemory
+    frames: np.ndarray
+    areas: np.ndarray
+
+    def __init__(
+        self,
+        slots: int,
+        height: int,
+        width: int,
+        area_scale: int = 1,
+        name: typing.Optional[str] = None
+    ):
+        self.slots = slots
+        self.height = height
+        self.width = width
+        self.area_scale = area_scale
+        area_h = height // area_scale
+        area_w = width // area_scale
+        frames_size = slots * height * width * 3
+        areas_size = slots * area_h * area_w * 4
+        if name is None:
+            self.shm = SharedMemory(create=True, size=frames_size + areas_size)
+        else:
+            # the worker processes share resource tracker of the owner,
+            # the owner removes memory block
+            self.shm = SharedMemory(name=name)
+
+        self.frames = np.ndarray(
+            (slots, height, width, 3), dtype="u1", buffer=self.shm.buf
+        )
+        self.areas = np.ndarray(
+            (slots, area_h, area_w),
+            dtype="f4",
+            buffer=self.shm.buf,
+            offset=frames_size
+        )
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def options(self) -> tuple:
+        """Arguments to attach the ring in other process.
+        """
+        return (
+            self.slots, self.height, self.width, self.area_scale, self.name
+        )
+
+    def close(self, unlink: bool = False):
+        del self.frames
+        del self.areas
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+frame_ring: typing.Optional[FrameRing] = None
+
+
+def attach_frame_ring(
+    slots: int, height: int, width: int, area_scale: int, name: str
+):
+    """Initializer of the camera worker process.
+    """
+    global frame_ring
+    frame_ring = FrameRing(slots, height, width, area_scale, name)
+
+
+def get_frame_ring() -> FrameRing:
+    return frame_ring
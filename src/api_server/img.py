@@ -1,155 +1,138 @@
-import base64
 import io
-import os
-import subprocess
 import typing
-import uuid
 
-import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 from PIL.Image import Image
+from PIL.Image import fromarray
 from PIL.Image import open as img_open
-from PIL.ImageFilter import BoxBlur
 
+from .camera import DEVICE
+from .camera import RESOLUTION
+from .camera import capture_frame
+from .detection import IMG_DETECTION_MODE
+from .detection import IMG_TILE_STD_LIMIT
+from .detection import get_background_model
+from .detection import get_detector
+from .frame_ring import get_frame_ring
 from .helpers import env_var_line
 from .helpers import env_var_time
+from .pyramid import get_pyramid
+from .roi import RoiMask
+from .roi import roi_mask
 
-DEVICE = env_var_line("WEBCAM_DEVICE") or "video0"
-RESOLUTION = env_var_line("WEBCAM_RESOLUTION") or "640x480"
 IMG_W, ING_H = map(int, RESOLUTION.split("x"))
 PATH_ACTUAL_IMG = (
     env_var_line("PATH_ACTUAL_IMG") or "/tmp/last_img.png"
 )
-BLUR_RAD = IMG_W // 100
 IMG_BLACK_LIMIT = 4
 
 NETWORK_CHECK_TIMEOUT = env_var_time("NETWORK_CHECK_TIMEOUT") or 600
-fig, ax = plt.subplots()
+# format: PIL format name and mime-type
+IMAGE_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+def capture_photo_slot(
+    slot: int, device: str = DEVICE
+) -> typing.Tuple[bool, typing.List[str]]:
+    """Get image from web camera, RGB frame and area for analysis
+    (level of pyramid) are written to the slot of shared frame ring.
+    """
+    ring = get_frame_ring()
+    # the ring has the resolution of camera
+    frame, lines = capture_frame(device, f"{ring.width}x{ring.height}")
+    if frame is None:
+        return False, lines
+
+    out = ring.frames[slot]
+    if frame.shape != out.shape:
+        frame = np.asarray(fromarray(frame).resize((ring.width, ring.height)))
+
+    out[...] = frame
+    levels = get_pyramid(ring.height, ring.width).update(out)
+    ring.areas[slot] = levels[ring.area_scale]
+    return True, lines
+
+
+def encode_image(
+    img: np.ndarray,
+    img_format: str = "png",
+    quality: int = 85,
+    max_size: typing.Optional[int] = None
+) -> bytes:
+    """RGB or grayscale matrix as encoded image,
+    the image is reduced to max_size by the longest side.
+    """
+    pil_format, _ = IMAGE_FORMATS[img_format]
+    image = fromarray(img)
+    if max_size and max(image.size) > max_size:
+        image.thumbnail((max_size, max_size))
+
+    with io.BytesIO() as buffer:
+        image.save(buffer, pil_format, quality=quality)
+        result = buffer.getvalue()
 
-ax.fmt_xdata = mdates.DateFormatter("%Y-%m-%d")
-ax.grid(True)
+    return result
 
 
-def get_png_photo(png_factor: int = 9) -> typing.Tuple[
-    typing.Optional[Image], typing.List[str]
-]:
-    """Get image from web camera.
-    apt-get install fswebcam
+def compare_areas(
+    source_area: np.array, new_area: np.array, roi: RoiMask = roi_mask
+) -> typing.Tuple[int, np.ndarray]:
+    """Return the probability of the images are similar in percents
+    and the deviation of each tile (of the regions of view).
     """
-    img_path = f"/tmp/{uuid.uuid4().hex}.png"
-    result = subprocess.run(
-        [
-            "/usr/bin/fswebcam",
-            "-r",
-            RESOLUTION,
-            "--no-banner",
-            "--device",
-            f"/dev/{DEVICE}",
-            "--png",
-            f"{png_factor}",
-            img_path,
-        ],
-        capture_output=True,
-        text=True
-    )
-    lines = result.stdout.split("\n")
-    if os.path.exists(img_path):
-        image = img_open(img_path)
-        os.remove(img_path)
-    else:
-        image = None
-
-    return image, lines
-
-
-def get_photo_area(
-    png_factor: int = 9,
-    img_filter: BoxBlur = BoxBlur(BLUR_RAD)
-) -> typing.Tuple[
-    typing.Optional[np.array], typing.List[str]
-]:
-    """Get image from web camera.
+    return get_detector(new_area.shape, roi).detect(source_area, new_area)
+
+
+def detect_area_changes(
+    prev_area: typing.Optional[np.ndarray],
+    new_area: np.ndarray,
+    camera: str = DEVICE,
+    roi: RoiMask = roi_mask
+) -> typing.Optional[typing.Tuple[int, np.ndarray, float]]:
+    """The probability of the area is similar (to the background
+    of the camera or the previous area by the detection mode)
+    in percents, the scores of tiles and the score limit of changed tile.
     """
-    image, data = get_png_photo(png_factor)
-    if image:
-        arr = np.asarray(image.filter(img_filter)) / 255
-        return np.mean(arr, axis=2), data
-
-    return None, data
+    if IMG_DETECTION_MODE == "background":
+        model = get_background_model(new_area.shape, camera, roi)
+        return (*model.detect(new_area), model.limit)
 
+    if prev_area is None:
+        return None
 
-def png_img_to_buffer(img: Image) -> io.BytesIO:
-    """Image data to base64
-    """
-    buffer = io.BytesIO()
-    img.save(buffer, "png")
-    buffer.seek(0)
-    return buffer
+    return (*compare_areas(prev_area, new_area, roi), IMG_TILE_STD_LIMIT)
 
 
-def png_img_to_base64(img: Image) -> str:
-    """Image data to base64
+def learn_background(
+    new_area: np.ndarray, camera: str = DEVICE, roi: RoiMask = roi_mask
+):
+    """The unchanged area (skipped by the prefilter) is learned by
+    the background model of the camera.
     """
-    with io.BytesIO() as buffer:
-        img.save(buffer, "png")
-        buffer.seek(0)
-        result = base64.b64encode(buffer.getvalue()).decode()
-
-    return result
+    if IMG_DETECTION_MODE == "background":
+        get_background_model(new_area.shape, camera, roi).update(new_area)
 
 
-def table_to_image(
-    data: pd.DataFrame, titile: str = ""
-) -> io.BytesIO:
-    """Create image with rate table.
+def area_to_gray(img: np.array) -> np.ndarray:
+    """Grayscale uint8 image of area for analysis.
     """
-    dia = data.plot()
-    if titile:
-        ax.set_title(titile)
-
-    buffer = io.BytesIO()
-    img = dia.get_figure()
-    img.savefig(buffer)
-    buffer.seek(0)
-    return buffer
+    img = (np.clip(img, 0, 1) * 255).astype("uint8")
+    img[img < IMG_BLACK_LIMIT] = 0
+    img[img > (255 - IMG_BLACK_LIMIT)] = 255
+    return img
 
 
-def compare_areas(source_area: np.array, new_area: np.array) -> float:
-    """Return the probability of the images are similar in percents.
-    """
-    if source_area.shape != source_area.shape:
-        return 0
-
-    w, h = source_area.shape
-    m = 12
-    part_w = w // m
-    part_h = h // m
-    diff = source_area - new_area
-    std = []
-    for i in range(m):
-        for j in range(m):
-            part = diff[
-                i * part_w:(i + 1) * part_w,
-                j * part_h:(j + 1) * part_h
-            ]
-            std.append(part.std())
-
-    over = sum(1 if x < 0.014 else 0 for x in std)
-    return round(over / len(std) * 100)
-
-
-def save_last_area(img: np.array):
+def save_last_area(img: np.array, path: str = PATH_ACTUAL_IMG):
     """Save image matrix.
     """
-    img = ((1 - img) * 255).astype("uint8")
-    img[img < IMG_BLACK_LIMIT] = 0
-    img[img > (255 - IMG_BLACK_LIMIT)] = 255
-    plt.imsave(PATH_ACTUAL_IMG, img, cmap="Greys")
+    fromarray(area_to_gray(img)).save(path, "png")
 
 
-def get_image_last_area() -> Image:
+def get_image_last_area(path: str = PATH_ACTUAL_IMG) -> Image:
     """Read lasr image.
     """
-    return img_open(PATH_ACTUAL_IMG)
+    return img_open(path)
@@ -0,0 +1,97 @@
+import typing
+
+import numpy as np
+
+from .helpers import env_var_int
+from .helpers import env_var_list
+
+# level for change detection
+IMG_ANALYSIS_SCALE = env_var_int("IMG_ANALYSIS_SCALE") or 4
+# downscale factors of levels
+IMG_PYRAMID_SCALES = tuple(sorted(
+    set(env_var_list("IMG_PYRAMID_SCALES") or (4, 8))
+    | {IMG_ANALYSIS_SCALE}
+))
+
+
+def level_shape(
+    height: int, width: int, scale: int
+) -> typing.Tuple[int, int]:
+    return height // scale, width // scale
+
+
+class AreaPyramid:
+    """Grayscale frame (mean of channels) and its levels downscaled
+    by block means, values of levels are float32 in [0..1].
+    Buffers are allocated once for the frame size and reused,
+    the block mean works also as blur for the detection.
+    """
+    height: int
+    width: int
+    gray: np.ndarray
+    columns: typing.Dict[int, np.ndarray]
+    sums: typing.Dict[int, np.ndarray]
+    levels: typing.Dict[int, np.ndarray]
+
+    def __init__(
+        self,
+        height: int,
+        width: int,
+        scales: typing.Tuple[int, ...] = IMG_PYRAMID_SCALES
+    ):
+        self.height = height
+        self.width = width
+        # sum of channels fits to uint16 (3 * 255)
+        self.gray = np.empty((height, width), dtype="u2")
+        self.columns = {}
+        self.sums = {}
+        self.levels = {}
+        for scale in scales:
+            shape = level_shape(height, width, scale)
+            self.columns[scale] = np.empty(
+                (shape[0] * scale, shape[1]), dtype="u2"
+            )
+            self.sums[scale] = np.empty(shape, dtype="u4")
+            self.levels[scale] = np.empty(shape, dtype="f4")
+
+    def update(self, frame: np.ndarray) -> typing.Dict[int, np.ndarray]:
+        """Levels of the new RGB uint8 frame.
+        """
+        # strided additions are much faster than sum by axis
+        gray = self.gray
+        np.add(frame[..., 0], frame[..., 1], out=gray, dtype="u2")
+        gray += frame[..., 2]
+        for scale, level in self.levels.items():
+            h, w = level.shape
+            # sum of columns of blocks and then sum of rows
+            columns = self.columns[scale]
+            blocks = gray[:h * scale, :w * scale].reshape(h * scale, w, scale)
+            columns[...] = blocks[:, :, 0]
+            for i in range(1, scale):
+                columns += blocks[:, :, i]
+
+            sums = self.sums[scale]
+            rows = columns.reshape(h, scale, w)
+            sums[...] = rows[:, 0]
+            for i in range(1, scale):
+                sums += rows[:, i]
+
+            np.multiply(
+                sums, 1 / (3 * 255 * scale * scale), out=level,
+                casting="unsafe"
+            )
+
+        return self.levels
+
+
+pyramid: typing.Optional[AreaPyramid] = None
+
+
+def get_pyramid(height: int, width: int) -> AreaPyramid:
+    """Pyramid of this process for frames of the size.
+    """
+    global pyramid
+    if pyramid is None or (pyramid.height, pyramid.width) != (height, width):
+        pyramid = AreaPyramid(height, width)
+
+    return pyramid
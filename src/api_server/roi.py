@@ -0,0 +1,124 @@
+import json
+import os
+import typing
+
+import numpy as np
+
+from .helpers import env_var_line
+
+# regions of interest and ignored regions of camera view
+IMG_ROI_PATH = env_var_line("IMG_ROI_PATH") or "/data/camera/roi.json"
+
+# x0, y0, x1, y1 in [0..1] of frame size and ignore flag
+Region = typing.Dict[str, typing.Any]
+
+
+class RoiMask:
+    """Regions of camera view: if there are regions of interest only
+    their tiles are analysed, tiles of ignored regions are never
+    analysed. Tile belongs to region by its center.
+    """
+    path: str
+    regions: typing.List[Region]
+    version: int
+    # masks of grids by size for the version of regions
+    masks: typing.Dict[typing.Tuple[int, int], np.ndarray]
+    masks_version: int
+
+    def __init__(self, path: str = IMG_ROI_PATH):
+        self.path = path
+        self.regions = []
+        self.version = 0
+        self.masks = {}
+        self.masks_version = 0
+
+    def load(self) -> int:
+        """Regions from file, returns their number.
+        """
+        try:
+            with open(self.path) as src:
+                regions = json.load(src)
+        except FileNotFoundError:
+            regions = []
+
+        self.regions = list(regions)
+        self.version += 1
+        return len(self.regions)
+
+    def update(self, regions: typing.List[Region]):
+        """Set and save regions.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as out:
+            json.dump(regions, out)
+
+        os.replace(f"{self.path}.tmp", self.path)
+        self.regions = list(regions)
+        self.version += 1
+
+    def set(self, regions: typing.List[Region], version: int):
+        """Regions of the server process (in the worker processes).
+        """
+        self.regions = list(regions)
+        self.version = version
+
+    def inside(
+        self, x: np.ndarray, y: np.ndarray, ignore: bool
+    ) -> typing.Optional[np.ndarray]:
+        """Points in any region of the kind or None if there are no such
+        regions.
+        """
+        result = None
+        for region in self.regions:
+            if bool(region.get("ignore")) != ignore:
+                continue
+
+            inside = (
+                (region["x0"] <= x) & (x < region["x1"]) &
+                (region["y0"] <= y) & (y < region["y1"])
+            )
+            result = inside if result is None else result | inside
+
+        return result
+
+    def contains(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Points (relative coordinates) which are analysed.
+        """
+        x = np.asarray(x, dtype="f8")
+        y = np.asarray(y, dtype="f8")
+        result = self.inside(x, y, False)
+        if result is None:
+            result = np.ones(x.shape, dtype="?")
+
+        ignored = self.inside(x, y, True)
+        if ignored is not None:
+            result &= ~ignored
+
+        return result
+
+    def grid_mask(self, rows: int, cols: int) -> np.ndarray:
+        """The analysed cells of grid rows x cols (pixels of area
+        or tiles), cell belongs to region by its center.
+        """
+        if self.masks_version != self.version:
+            self.masks.clear()
+            self.masks_version = self.version
+
+        mask = self.masks.get((rows, cols))
+        if mask is None:
+            y, x = np.meshgrid(
+                (np.arange(rows) + 0.5) / rows,
+                (np.arange(cols) + 0.5) / cols,
+                indexing="ij"
+            )
+            mask = self.masks[rows, cols] = self.contains(x, y)
+
+        return mask
+
+    def tiles(self, grid: int) -> np.ndarray:
+        """Flat indexes of the analysed tiles of grid x grid.
+        """
+        return np.flatnonzero(self.grid_mask(grid, grid))
+
+
+roi_mask = RoiMask()
@@ -1,6 +1,8 @@
 # OrangePi peripheries access server
 
 import asyncio
+import base64
+import itertools
 import logging
 import os
 import subprocess
@@ -10,34 +12,71 @@ from datetime import date
 from datetime import datetime
 from datetime import time
 from datetime import timedelta
+from functools import partial
 
+import numpy as np
+from fastapi import Depends
 from fastapi import FastAPI
+from fastapi import Header
 from fastapi import HTTPException
+from fastapi import Query
 from pydantic import BaseModel
+from pydantic import validator
+from starlette.responses import Response
 from starlette.responses import StreamingResponse
 
+from .analysis import Changes
+from .analysis import analyse_slot
+from .cache import BOOT_ID
+from .cache import BytesCache
+from .cache import ChartCache
+from .cameras import Camera
+from .cameras import create_cameras
+from .capture_scheduler import CAMERA_CHECK_INTERVAL
+from .chart import CHART_FORMATS
+from .chart import get_renderer
+from .chart import prewarm_renderer
+from .clips import clip_filepath
+from .clips import clip_name_rx
+from .clips import clip_names
+from .clips import read_clip_index
+from .clips import read_clip_range
+from .clips import write_clip
+from .detection import IMG_COMPARE_GRID
+from .detection import changed_box
+from .downsample import downsample
+from .fair_pool import FairPool
+from .helpers import current_date
 from .helpers import current_datetime
+from .helpers import current_time
 from .helpers import env_var_bool
+from .helpers import env_var_float
 from .helpers import env_var_int
 from .helpers import env_var_line
 from .helpers import env_var_list
 from .helpers import env_var_time
-from .img import compare_areas
+from .img import IMAGE_FORMATS
+from .img import area_to_gray
+from .img import encode_image
 from .img import get_image_last_area
-from .img import get_photo_area
-from .img import get_png_photo
-from .img import png_img_to_base64
-from .img import png_img_to_buffer
 from .img import save_last_area
-from .img import table_to_image
 from .network_check import check
 from .supervisor_rpc import supervisor_restart
 from .temperature import TEMPERATURE_READ_INTERVAL
+from .temperature import TEMPERATURE_SENSOR
+from .temperature import TEMPERATURE_STALE_TIME
+from .temperature import build_rollups
 from .temperature import clear_tempearture_storage
+from .temperature import compress_tempearture_storage
 from .temperature import cpu_temperature
-from .temperature import read_temperature
+from .temperature import iter_temperature_history
+from .temperature import migrate_storage
 from .temperature import read_temperature_history
+from .temperature import resample_seconds
 from .temperature import save_tempearture
+from .temperature import sensor_rx
+from .temperature import temperature_sampler
+from .temperature import temperature_series
 
 BOARD_NAME = env_var_line("BOARD_NAME") or "PCPCPLUS"
 try:
@@ -52,13 +91,28 @@ else:
 
 REBOOT_ALLOW = env_var_bool("REBOOT_ALLOW")
 NETWORK_CHECK_TIMEOUT = env_var_time("NETWORK_CHECK_TIMEOUT") or 600
-CAMERA_CHECK_INTERVAL = env_var_int("CAMERA_CHECK_INTERVAL") or 5
 # percent 70% by default
 IMG_COMPARE_LIMIT = env_var_int("IMG_COMPARE_LIMIT") or 70
 PINS = env_var_list("PINS")
 DEFAULT_WATCH_ITER_TIME = 1
 GPIO_STATA_OFF = True
 GPIO_STATA_ON = False
+# rows in one part of streaming response
+STREAM_CHUNK = 4096
+CHART_CACHE_PATH = env_var_line("CHART_CACHE_PATH") or "/tmp/charts"
+# in mb
+CHART_CACHE_SIZE = env_var_int("CHART_CACHE_SIZE") or 8
+CHART_CACHE_DISK_SIZE = env_var_int("CHART_CACHE_DISK_SIZE") or 50
+# encoded images of the latest frames, in mb
+IMAGE_CACHE_SIZE = env_var_int("IMAGE_CACHE_SIZE") or 4
+# crops of changed regions of camera events
+EVENT_CROP_MAX_SIZE = env_var_int("EVENT_CROP_MAX_SIZE") or 320
+EVENT_CROP_QUALITY = env_var_int("EVENT_CROP_QUALITY") or 75
+# in mb
+EVENT_CROPS_SIZE = env_var_int("EVENT_CROPS_SIZE") or 2
+# the oldest frame of photo in seconds (a new frame is captured)
+PHOTO_MAX_AGE = env_var_float("PHOTO_MAX_AGE") or CAMERA_CHECK_INTERVAL
+IMAGE_FORMATS_RX = "(?i)^({})$".format("|".join(IMAGE_FORMATS))
 
 logger = logging.getLogger(env_var_line("LOGGER") or "uvicorn.error")
 
@@ -66,11 +120,144 @@ logger = logging.getLogger(env_var_line("LOGGER") or "uvicorn.error")
 class ServerApp(FastAPI):
     current_state: dict
     ps_executor = ProcessPoolExecutor()
+    # cameras by name, each camera has the process with its device
+    cameras: typing.Dict[str, Camera]
+    # jobs of cameras in the worker pool
+    camera_pool: FairPool
 
 
 class IntervalParams(BaseModel):
     begin: date
     end: date
+    # time bucket as pandas offset "30s", "60min", "1D"
+    resample: typing.Optional[str] = None
+    # sensor id, the main sensor by default
+    sensor: typing.Optional[str] = None
+    # limit of points in answer (min and max values of time buckets)
+    max_points: typing.Optional[int] = None
+
+    @validator("resample")
+    def check_resample(cls, value):
+        if value and resample_seconds(value) <= 0:
+            raise ValueError(f"Wrong resample value: {value}")
+
+        return value
+
+    @validator("max_points")
+    def check_max_points(cls, value):
+        if value is not None and value < 4:
+            raise ValueError("Value max_points should be 4 or more")
+
+        return value
+
+    @validator("sensor")
+    def check_sensor(cls, value):
+        if value and not sensor_rx.match(value):
+            raise ValueError(f"Wrong sensor id: {value}")
+
+        return value
+
+
+class ChartParams(IntervalParams):
+    # width x height in pixels
+    size: str = "640x480"
+    dpi: int = 100
+    # jpeg, png, webp
+    format: str = "jpeg"
+    quality: int = 85
+
+    @validator("quality")
+    def check_quality(cls, value):
+        if not 1 <= value <= 100:
+            raise ValueError(f"Wrong image quality: {value}")
+
+        return value
+
+    @validator("dpi")
+    def check_dpi(cls, value):
+        if not 20 <= value <= 600:
+            raise ValueError(f"Wrong chart dpi: {value}")
+
+        return value
+
+    @validator("format")
+    def check_format(cls, value):
+        value = value.lower()
+        if value not in CHART_FORMATS:
+            raise ValueError(f"Unsupported chart format: {value}")
+
+        return value
+
+    @validator("size")
+    def check_size(cls, value):
+        w, h = map(int, value.lower().split("x"))
+        if not (100 <= w <= 4096 and 100 <= h <= 4096):
+            raise ValueError(f"Wrong chart size: {value}")
+
+        return f"{w}x{h}"
+
+
+class ImageOptions(BaseModel):
+    img_format: str = "png"
+    quality: int = 85
+    # the longest side of image in pixels, original size if it is empty
+    max_size: typing.Optional[int] = None
+
+    @property
+    def media_type(self) -> str:
+        _, media_type = IMAGE_FORMATS[self.img_format]
+        return media_type
+
+    @property
+    def key(self) -> str:
+        return f"{self.img_format}|{self.quality}|{self.max_size}"
+
+
+def image_options(
+    format: str = Query("png", regex=IMAGE_FORMATS_RX),
+    quality: int = Query(85, ge=1, le=100),
+    max_size: typing.Optional[int] = Query(None, ge=16, le=4096)
+) -> ImageOptions:
+    """Query parameters of image endpoints.
+    """
+    return ImageOptions(
+        img_format=format.lower(), quality=quality, max_size=max_size
+    )
+
+
+class RoiRegion(BaseModel):
+    # relative coordinates [0..1] of frame
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    # ignored region or region of interest
+    ignore: bool = True
+
+    @validator("x0", "y0", "x1", "y1")
+    def check_coordinate(cls, value):
+        if not 0 <= value <= 1:
+            raise ValueError(f"Wrong region coordinate: {value}")
+
+        return value
+
+    @validator("x1")
+    def check_width(cls, value, values):
+        if "x0" in values and value <= values["x0"]:
+            raise ValueError("Value x1 should be more than x0")
+
+        return value
+
+    @validator("y1")
+    def check_height(cls, value, values):
+        if "y0" in values and value <= values["y0"]:
+            raise ValueError("Value y1 should be more than y0")
+
+        return value
+
+
+class RoiParams(BaseModel):
+    regions: typing.List[RoiRegion]
 
 
 class GpioStateParams(BaseModel):
@@ -92,39 +279,147 @@ class GpioScheduleParams(BaseModel):
 
 
 app = ServerApp()
+chart_cache = ChartCache(
+    CHART_CACHE_PATH,
+    CHART_CACHE_SIZE * 1024 ** 2,
+    CHART_CACHE_DISK_SIZE * 1024 ** 2
+)
+image_cache = BytesCache(IMAGE_CACHE_SIZE * 1024 ** 2)
+event_crops = BytesCache(EVENT_CROPS_SIZE * 1024 ** 2)
+# events of all cameras
+event_ids = itertools.count(1)
+
+
+def save_last_image(camera: Camera):
+    """Last analysed area of camera to disk.
+    """
+    if camera.last_image is not None:
+        try:
+            save_last_area(camera.last_image, camera.area_path)
+        except Exception as err:
+            logger.error(f"Image area save error ({camera.name}): {err}")
+
+
+async def save_event_crop(
+    camera: Camera,
+    event_id: int,
+    frame: np.ndarray,
+    box: typing.Tuple[int, int, int, int]
+):
+    """Small image of the changed region of event.
+    """
+    left, top, right, bottom = box
+    try:
+        # the job can wait for its turn, the slot of ring is reused
+        data = await app.camera_pool.run(
+            camera.name,
+            encode_image,
+            frame[top:bottom, left:right].copy(),
+            "jpeg",
+            EVENT_CROP_QUALITY,
+            EVENT_CROP_MAX_SIZE
+        )
+    except Exception as err:
+        logger.error(f"Event crop error: {err}")
+    else:
+        event_crops.set(f"{BOOT_ID}|{event_id}", data)
 
 
-async def watch_image_changes(state: dict, pool: ProcessPoolExecutor):
-    """Compare images.
+async def save_clip(
+    camera: Camera,
+    name: str,
+    frames: typing.List[typing.Tuple[np.ndarray, datetime]]
+):
+    """Frames of event to clip file in the worker pool.
+    """
+    try:
+        info = await app.camera_pool.run(
+            camera.name, partial(write_clip, camera=camera.name), name, frames
+        )
+    except Exception as err:
+        logger.error(f"Clip {name} saving error: {err}")
+    else:
+        logger.info(f"Clip {name}: {len(frames)} frames {info['size']} b")
+
+
+async def analyse_frame(
+    camera: Camera, slot: int, reset: bool
+) -> typing.Optional[Changes]:
+    """Changes of the frame in the ring slot, the frame is analysed
+    in the worker process of camera (with its detection state).
     """
     loop = asyncio.get_running_loop()
-    while state.get("active"):
-        try:
-            img, out_data = await loop.run_in_executor(pool, get_photo_area)
-        except Exception as err:
-            img = None
-            logger.error("Photo getting error: %s", err)
-            continue
+    try:
+        result, camera.prefilter = await loop.run_in_executor(
+            camera.executor,
+            analyse_slot,
+            slot,
+            camera.name,
+            camera.roi.regions,
+            camera.roi.version,
+            reset
+        )
+    except Exception as err:
+        logger.error(f"Camera {camera.name} analysis error: {err}")
+        return None
 
-        if img:
-            try:
-                save_last_area(img)
-            except Exception as err:
-                logger.error(f"Image area save error: {err}")
-        else:
-            logger.warning(
-                "Photo getting problem: %s", " ".join(out_data)
-            )
+    return result
 
-        prev_img = state.get("last_image")
-        state["last_image"] = img
-        if not(prev_img is None or img is None):
-            prop = compare_areas(prev_img, img)
-            if prop < IMG_COMPARE_LIMIT:
-                logger.warning(f"Camera changes detected {prop}")
-                state["image_events"].append((prop, current_datetime()))
 
-        await asyncio.sleep(CAMERA_CHECK_INTERVAL)
+async def watch_image_changes(state: dict, camera: Camera):
+    """The capture loop of camera: new frame for all consumers and
+    detection of changes (if the prefilter sees changes).
+    The interval of capture depends on activity of scene.
+    """
+    hub = camera.hub
+    scheduler = camera.scheduler
+    clip_recorder = camera.clip_recorder
+    while state.get("active"):
+        started = current_time()
+        changed = False
+        done = await hub.capture()
+        # the frame of this iteration (captures on request change hub)
+        frame, version, dt, slot = hub.frame, hub.version, hub.dt, hub.slot
+        # own copy: the slot of ring is reused by captures on request
+        img = hub.area.copy() if done else None
+        if img is not None:
+            clip = clip_recorder.push(frame, dt)
+            if clip:
+                asyncio.get_running_loop().create_task(
+                    save_clip(camera, *clip)
+                )
+
+        # detection state is reset after the missed frame
+        reset = camera.last_image is None
+        camera.last_image = img
+        camera.last_image_version = version
+        result = None
+        if img is not None:
+            result = await analyse_frame(camera, slot, reset)
+
+        if result is not None:
+            prop, scores, limit, spots = result
+            camera.spots = {"version": version, "dt": dt, "spots": spots}
+            if prop < IMG_COMPARE_LIMIT:
+                changed = True
+                logger.warning(f"Camera {camera.name} changes detected {prop}")
+                box = changed_box(scores, img.shape, frame.shape, limit)
+                event_id = next(event_ids)
+                clip_recorder.trigger(event_id, dt)
+                camera.events.append((
+                    prop,
+                    current_datetime(),
+                    event_id,
+                    box,
+                    spots,
+                    clip_recorder.name,
+                ))
+                save_last_image(camera)
+                if box:
+                    await save_event_crop(camera, event_id, frame, box)
+
+        scheduler.update(changed, current_time() - started)
+        await asyncio.sleep(scheduler.interval())
 
 
 async def temperature_watcher(state: dict):
@@ -132,13 +427,25 @@ async def temperature_watcher(state: dict):
     """
     while state.get("active"):
         await asyncio.sleep(TEMPERATURE_READ_INTERVAL)
-        save_tempearture()
+        for sensor in temperature_sampler.sensors:
+            save_tempearture(
+                temperature_sampler.latest(
+                    sensor, max_age=TEMPERATURE_STALE_TIME
+                ),
+                sensor
+            )
 
 
 async def temperature_storage_watcher(state: dict):
-    """Check size of temperature storage.
+    """Compress closed months and check size of temperature storage.
     """
+    loop = asyncio.get_running_loop()
     while state.get("active"):
+        try:
+            await loop.run_in_executor(None, compress_tempearture_storage)
+        except Exception as err:
+            logger.critical(f"Storage compression error: {err}")
+
         try:
             clear_tempearture_storage()
         except Exception as err:
@@ -233,16 +540,18 @@ async def initial_task():
     """Background logic.
     """
     app.ps_executor = ProcessPoolExecutor(
-        max_workers=env_var_int("WORKERS_PS_EXECUTER") or 4
+        max_workers=env_var_int("WORKERS_PS_EXECUTER") or 4,
+        initializer=prewarm_renderer
     )
+    app.camera_pool = FairPool(app.ps_executor)
+    app.cameras = create_cameras()
+    logger.info(f"Cameras: {list(app.cameras)}")
     logger.info(f"Pins: {PINS}")
     pins = list(map(int, PINS))
     PINS.clear()
     PINS.extend(pins)
     app.current_state = {
         "active": True,
-        "last_image": None,
-        "image_events": [],
         "pins": {pin: False for pin in pins},
         "pins_time": {},
         "pins_schedule": []
@@ -254,10 +563,32 @@ async def initial_task():
 
     logger.info("Setup service tasks..")
     loop = asyncio.get_running_loop()
+    for camera in app.cameras.values():
+        try:
+            n = camera.roi.load()
+        except Exception as err:
+            logger.error(
+                f"Camera {camera.name} regions of view loading error: {err}"
+            )
+        else:
+            logger.info(f"Camera {camera.name} regions of view: {n}")
+
+    for storage_task in (migrate_storage, build_rollups):
+        try:
+            n = await loop.run_in_executor(None, storage_task)
+        except Exception as err:
+            logger.critical(f"Storage {storage_task.__name__} error: {err}")
+        else:
+            if n:
+                logger.warning(f"Storage {storage_task.__name__}: {n} files")
+
+    loop.create_task(temperature_sampler.run(app.current_state))
     loop.create_task(temperature_watcher(app.current_state))
     loop.create_task(temperature_storage_watcher(app.current_state))
     loop.create_task(network_watcher(app.current_state))
-    loop.create_task(watch_image_changes(app.current_state, app.ps_executor))
+    for camera in app.cameras.values():
+        loop.create_task(watch_image_changes(app.current_state, camera))
+
     loop.create_task(gpio_watcher(app.current_state))
 
 
@@ -266,11 +597,26 @@ async def close_app():
     """Off all.
     """
     app.current_state["active"] = False
+    for camera in app.cameras.values():
+        save_last_image(camera)
+        clip = camera.clip_recorder.finish()
+        if clip:
+            try:
+                write_clip(*clip, camera=camera.name)
+            except Exception as err:
+                logger.error(f"Clip saving error: {err}")
+
     try:
         app.ps_executor.shutdown(wait=False, cancel_futures=True)
     except Exception as err:
         logger.error(f"Close executer error: {err}")
 
+    for camera in app.cameras.values():
+        try:
+            camera.close()
+        except Exception as err:
+            logger.error(f"Close camera {camera.name} error: {err}")
+
 
 @app.get("/")
 async def root_page_api():
@@ -282,40 +628,76 @@ async def root_page_api():
 
 
 @app.get("/t")
-async def temperature_api():
-    value = read_temperature()
-    if value is None:
-        result = None
-    else:
-        result = f"{round(value, 2):0.2f} C"
+async def temperature_api(sensor: str = TEMPERATURE_SENSOR):
+    """The last value of sensor (the main sensor by default)
+    and values of all sensors.
+    """
+    values = {}
+    for sensor_id in temperature_sampler.sensors:
+        value = temperature_sampler.latest(sensor_id)
+        values[sensor_id] = f"{round(value, 2):0.2f} C"
 
-    return {"temperature": result}
+    dt = temperature_sampler.dts.get(sensor)
+    age = temperature_sampler.age(sensor)
+    return {
+        "temperature": values.get(sensor),
+        "sensor": sensor,
+        "dt": dt.isoformat() if dt else None,
+        "age": round(age, 1) if dt else None,
+        "stale": age > TEMPERATURE_STALE_TIME,
+        "sensors": values,
+    }
 
 
-def create_temperature_history_list(begin: date, end: date) -> list:
+def create_temperature_history_list(
+    begin: date,
+    end: date,
+    resample: typing.Optional[str] = None,
+    sensor: typing.Optional[str] = None,
+    max_points: typing.Optional[int] = None
+) -> list:
     """List of values of temperature log.
     """
-    data = read_temperature_history(begin, end)
+    ts, values = temperature_series(sensor).read(
+        begin, end, resample_seconds(resample) if resample else 0
+    )
+    if max_points:
+        ts, values = downsample(ts, values, max_points)
+
+    dts = ts.astype("datetime64[s]").astype(str)
     return [
-        [dt.to_pydatetime().isoformat(), float(val)]
-        for dt, val in data.itertuples(index=False)
+        [dt, round(float(value), 2)]
+        for dt, value in zip(dts, values)
     ]
 
 
 def create_temperature_history_chart(
-    begin: date, end: date, resample: str = "60min"
-):
-    """Image data as io buffer.
+    begin: date,
+    end: date,
+    resample: str = "60min",
+    sensor: typing.Optional[str] = None,
+    size: str = "640x480",
+    dpi: int = 100,
+    img_format: str = "jpeg",
+    quality: int = 85
+) -> bytes:
+    """Image data.
     """
-    data = read_temperature_history(begin, end)
-    data.columns = ["dt", "temperature"]
+    data = read_temperature_history(
+        begin, end, resample_seconds(resample), sensor
+    )
     data.set_index("dt", inplace=True)
-    row_data = data.resample(resample).mean()
-    row_data.temperature.interpolate(method="linear", inplace=True)
-    row_data.temperature.interpolate(method="ffill", inplace=True)
-    row_data.temperature.interpolate(method="bfill", inplace=True)
-    buffer = table_to_image(row_data, titile=f"Temperature {begin}-{end}")
-    return buffer
+    values = data.value.resample(resample).mean()
+    values = values.interpolate(method="linear").ffill().bfill()
+    return get_renderer().render(
+        values.index.values,
+        values.values,
+        title=f"Temperature {begin}-{end}",
+        size=tuple(map(int, size.split("x"))),
+        dpi=dpi,
+        img_format=img_format,
+        quality=quality
+    )
 
 
 @app.post("/t/history")
@@ -327,23 +709,132 @@ async def temperature_history_api(intval: IntervalParams):
         app.ps_executor,
         create_temperature_history_list,
         intval.begin,
-        intval.end
+        intval.end,
+        intval.resample,
+        intval.sensor,
+        intval.max_points
     )
     return {"history": data}
 
 
+def temperature_history_lines(
+    begin: date,
+    end: date,
+    resample: typing.Optional[str] = None,
+    sensor: typing.Optional[str] = None
+) -> typing.Iterator[str]:
+    """Log of temperature as lines of NDJSON ["<iso datetime>", <value>].
+    """
+    for ts, values in iter_temperature_history(
+        begin,
+        end,
+        resample_seconds(resample) if resample else 0,
+        sensor,
+        STREAM_CHUNK
+    ):
+        dts = ts.astype("datetime64[s]").astype(str)
+        yield "".join(
+            f'["{dt}", {value:0.2f}]\n' for dt, value in zip(dts, values)
+        )
+
+
+@app.post("/t/history.ndjson")
+async def temperature_history_api_ndjson(intval: IntervalParams):
+    """Log of temperature of time interval as stream of rows,
+    the first rows are sent without waiting for the whole interval.
+    """
+    return StreamingResponse(
+        temperature_history_lines(
+            intval.begin, intval.end, intval.resample, intval.sensor
+        ),
+        media_type="application/x-ndjson"
+    )
+
+
+async def cached_image(
+    key: str,
+    encode: typing.Callable,
+    *args,
+    camera: typing.Optional[Camera] = None
+) -> typing.Tuple[str, bytes]:
+    """Entity tag and encoded image from cache,
+    the image is encoded in the worker pool if it is missing
+    (in turn of the camera for images of camera).
+    """
+    item = image_cache.get(key)
+    if item is None:
+        if camera is None:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(app.ps_executor, encode, *args)
+        else:
+            data = await app.camera_pool.run(camera.name, encode, *args)
+
+        item = image_cache.set(key, data), data
+
+    return item
+
+
+def image_response(
+    etag: str,
+    data: bytes,
+    media_type: str,
+    if_none_match: typing.Optional[str] = None
+) -> Response:
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return Response(data, media_type=media_type, headers={"ETag": etag})
+
+
 @app.post("/t/history.jpeg")
-async def temperature_history_api_jpeg(intval: IntervalParams):
+async def temperature_history_api_jpeg(
+    intval: ChartParams,
+    if_none_match: typing.Optional[str] = Header(None)
+):
     """Log of temperature of time interval as chart.
+    The charts of closed days are cached permanently,
+    the charts with today are valid until a new value is saved.
     """
-    loop = asyncio.get_running_loop()
-    data = await loop.run_in_executor(
-        app.ps_executor,
-        create_temperature_history_chart,
+    resample = intval.resample or "60min"
+    sensor = intval.sensor or TEMPERATURE_SENSOR
+    closed = intval.end < current_date()
+    key = "|".join(map(str, (
         intval.begin,
-        intval.end
-    )
-    return StreamingResponse(data, media_type="image/jpeg")
+        intval.end,
+        resample,
+        intval.size,
+        intval.dpi,
+        intval.format,
+        intval.quality,
+        sensor,
+    )))
+    if not closed:
+        key = f"{key}|{BOOT_ID}|{temperature_series(sensor).version}"
+
+    item = chart_cache.get(key)
+    if item is None:
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(
+            app.ps_executor,
+            create_temperature_history_chart,
+            intval.begin,
+            intval.end,
+            resample,
+            sensor,
+            intval.size,
+            intval.dpi,
+            intval.format,
+            intval.quality
+        )
+        if closed:
+            etag = chart_cache.save(key, data)
+        else:
+            etag = chart_cache.set(key, data)
+    else:
+        etag, data = item
+
+    _, media_type = CHART_FORMATS[intval.format]
+    return image_response(etag, data, media_type, if_none_match)
 
 
 @app.get("/check-internet")
@@ -353,67 +844,417 @@ async def check_internet_api():
     }
 
 
+def get_camera(name: typing.Optional[str] = None) -> Camera:
+    """Camera by name, the main camera by default.
+    """
+    if name is None:
+        return next(iter(app.cameras.values()))
+
+    camera = app.cameras.get(name)
+    if camera is None:
+        raise HTTPException(status_code=404, detail="Camera not found")
+
+    return camera
+
+
+async def photo_image(
+    camera: Camera,
+    options: ImageOptions,
+    max_age: typing.Optional[float] = None
+) -> typing.Optional[typing.Tuple[str, str, bytes]]:
+    """The latest frame (or new one) of camera as encoded image
+    with cache key and entity tag.
+    """
+    hub = camera.hub
+    frame = await hub.get(max_age)
+    if frame is None:
+        return None
+
+    key = f"photo|{BOOT_ID}|{camera.name}|{hub.version}|{options.key}"
+    if image_cache.get(key) is None:
+        # the job can wait for its turn, the slot of ring is reused
+        frame = frame.copy()
+
+    return (key, *await cached_image(
+        key,
+        encode_image,
+        frame,
+        options.img_format,
+        options.quality,
+        options.max_size,
+        camera=camera
+    ))
+
+
 @app.get("/photo.png")
-async def make_photo():
-    """Photo from web camera.
+@app.get("/cameras/{camera}/photo.png")
+async def make_photo(
+    camera: typing.Optional[str] = None,
+    max_age: float = Query(PHOTO_MAX_AGE, ge=0),
+    options: ImageOptions = Depends(image_options),
+    if_none_match: typing.Optional[str] = Header(None)
+):
+    """Photo from web camera (the latest frame of capture loop
+    or new one if the latest frame is older than max_age seconds,
+    PHOTO_MAX_AGE by default),
+    the main camera by default.
+    Format (png by default, jpeg, webp), quality and maximum size
+    are set by query parameters.
     """
-    loop = asyncio.get_running_loop()
-    img, _ = await loop.run_in_executor(app.ps_executor, get_png_photo)
-    if img:
-        result = StreamingResponse(
-            png_img_to_buffer(img), media_type="image/png"
-        )
-    else:
-        result = HTTPException(status_code=404, detail="Camera not available")
+    item = await photo_image(get_camera(camera), options, max_age)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Camera not available")
 
-    return result
+    _, etag, data = item
+    return image_response(etag, data, options.media_type, if_none_match)
 
 
 @app.get("/last_img.png")
-async def last_img():
-    """Photo from last time detection.
+@app.get("/cameras/{camera}/last_img.png")
+async def last_img(
+    camera: typing.Optional[str] = None,
+    options: ImageOptions = Depends(image_options),
+    if_none_match: typing.Optional[str] = Header(None)
+):
+    """Photo from last time detection (rendered on request, it is kept
+    until the next frame).
+    """
+    camera = get_camera(camera)
+    img = camera.last_image
+    if img is None:
+        try:
+            img = np.asarray(get_image_last_area(camera.area_path))
+        except Exception as err:
+            logger.error(f"Read last image error: {err}")
+            raise HTTPException(
+                status_code=404, detail="Last image doesn't exists"
+            )
+
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(
+            app.ps_executor,
+            encode_image,
+            img,
+            options.img_format,
+            options.quality,
+            options.max_size
+        )
+        return Response(data, media_type=options.media_type)
+
+    etag, data = await cached_image(
+        "|".join(map(str, (
+            "last_img",
+            BOOT_ID,
+            camera.name,
+            camera.last_image_version,
+            options.key,
+        ))),
+        encode_image,
+        area_to_gray(img),
+        options.img_format,
+        options.quality,
+        options.max_size,
+        camera=camera
+    )
+    return image_response(etag, data, options.media_type, if_none_match)
+
+
+@app.get("/photo.json")
+@app.get("/cameras/{camera}/photo.json")
+async def make_json_photo(
+    camera: typing.Optional[str] = None,
+    max_age: float = Query(PHOTO_MAX_AGE, ge=0),
+    options: ImageOptions = Depends(image_options),
+    if_none_match: typing.Optional[str] = Header(None)
+):
+    """Photo from web camera in base64.
+    """
+    item = await photo_image(get_camera(camera), options, max_age)
+    if item is None:
+        return {"error": "Camera not available"}
+
+    key, _, img_data = item
+    key = f"{key}|base64"
+    item = image_cache.get(key)
+    if item is None:
+        data = base64.b64encode(img_data)
+        item = image_cache.set(key, data), data
+
+    etag, data = item
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return Response(
+        b'{"image": "' + data + b'"}',
+        media_type="application/json",
+        headers={"ETag": etag}
+    )
+
+
+def camera_state(camera: Camera) -> dict:
+    hub = camera.hub
+    return {
+        "name": camera.name,
+        "version": hub.version,
+        "dt": hub.dt.isoformat() if hub.dt else None,
+        "age": round(hub.age, 1) if hub.dt else None,
+        "prefilter": camera.prefilter,
+        "scheduler": camera.scheduler.stats(),
+        "events": len(camera.events),
+    }
+
+
+@app.get("/cameras")
+async def cameras_api():
+    """Cameras (the main camera first) with state of their capture loops
+    and jobs of cameras in the worker pool.
+    """
+    return {
+        "cameras": [camera_state(camera) for camera in app.cameras.values()],
+        "pool": app.camera_pool.stats(),
+    }
+
+
+@app.get("/camera-state")
+@app.get("/cameras/{camera}/state")
+async def camera_state_api(camera: typing.Optional[str] = None):
+    """State of the capture loop, counters of the prefilter
+    and the effective rate of capture.
     """
+    return camera_state(get_camera(camera))
+
+
+@app.get("/spots")
+@app.get("/cameras/{camera}/spots")
+async def light_spots_api(camera: typing.Optional[str] = None):
+    """Bright spots of the latest analysed frame: centroid and area
+    in pixels of frame, mean intensity (0..1).
+    """
+    spots = get_camera(camera).spots
+    if not spots:
+        return {"version": None, "dt": None, "spots": []}
+
+    return {
+        "version": spots["version"],
+        "dt": spots["dt"].isoformat(),
+        "spots": spots["spots"],
+    }
+
+
+def roi_state(camera: Camera) -> dict:
+    return {
+        "regions": camera.roi.regions,
+        "grid": IMG_COMPARE_GRID,
+        "tiles": camera.roi.tiles(IMG_COMPARE_GRID).tolist(),
+    }
+
+
+@app.get("/roi")
+@app.get("/cameras/{camera}/roi")
+async def roi_api(camera: typing.Optional[str] = None):
+    """Regions of camera view and the analysed tiles (flat indexes
+    of grid x grid).
+    """
+    return roi_state(get_camera(camera))
+
+
+@app.post("/roi")
+@app.post("/cameras/{camera}/roi")
+async def roi_update_api(
+    params: RoiParams, camera: typing.Optional[str] = None
+):
+    """Set regions of interest and ignored regions of camera view,
+    without regions of interest the whole view is analysed.
+    """
+    camera = get_camera(camera)
     try:
-        img = get_image_last_area()
+        camera.roi.update([region.dict() for region in params.regions])
     except Exception as err:
-        img = None
-        logger.error(f"Read last image error: {err}")
-
-    if img:
-        result = StreamingResponse(
-            png_img_to_buffer(img), media_type="image/png"
+        logger.error(
+            f"Camera {camera.name} regions of view saving error: {err}"
         )
+        raise HTTPException(status_code=500, detail=f"{err}")
+
+    return roi_state(camera)
+
+
+@app.get("/photo-events")
+@app.get("/cameras/{camera}/photo-events")
+async def photo_events_api(camera: typing.Optional[str] = None):
+    """Events from camera (from all cameras by default) with the boxes
+    of changed regions and links to their images.
+    """
+    if camera is None:
+        cameras = list(app.cameras.values())
     else:
-        result = HTTPException(
-            status_code=404, detail="Last image doesn't exists"
-        )
+        cameras = [get_camera(camera)]
+
+    events = sorted(
+        (
+            (*event, item.name)
+            for item in cameras
+            for event in item.events
+        ),
+        key=lambda event: event[1]
+    )
+    result = {
+        "data": {dt.isoformat(): value for value, dt, *_ in events},
+        "events": [
+            {
+                "camera": name,
+                "dt": dt.isoformat(),
+                "value": value,
+                "box": box,
+                "crop": f"/photo-events/{event_id}.jpeg" if box else None,
+                "spots": spots,
+                "clip": clip,
+            }
+            for value, dt, event_id, box, spots, clip, name in events
+        ],
+    }
+    for item in cameras:
+        item.events.clear()
 
     return result
 
 
-@app.get("/photo.json")
-async def make_json_photo():
-    """Photo from web camera in base64.
+@app.get("/photo-events/{event_id}.jpeg")
+async def photo_event_crop_api(
+    event_id: int, if_none_match: typing.Optional[str] = Header(None)
+):
+    """Image of the changed region of event.
+    """
+    item = event_crops.get(f"{BOOT_ID}|{event_id}")
+    if item is None:
+        raise HTTPException(status_code=404, detail="Event image not found")
+
+    etag, data = item
+    return image_response(etag, data, "image/jpeg", if_none_match)
+
+
+def byte_range(
+    value: typing.Optional[str], size: int
+) -> typing.Optional[typing.Tuple[int, int]]:
+    """Range [begin..end) from header "Range: bytes=begin-last"
+    (or "begin-", "-suffix"), None for the whole content.
     """
-    img, _ = get_png_photo()
-    if img:
-        result = {"image": png_img_to_base64(img)}
+    if not value:
+        return None
+
+    unit, _, spec = value.partition("=")
+    first, _, last = spec.split(",")[0].strip().partition("-")
+    if unit.strip() != "bytes":
+        raise ValueError(f"Unsupported range unit: {unit}")
+
+    if first:
+        begin = int(first)
+        end = min(int(last) + 1, size) if last else size
     else:
-        result = {"error": "Camera not available"}
+        begin = max(size - int(last), 0)
+        end = size
 
-    return result
+    if not 0 <= begin < end:
+        raise ValueError(f"Unsatisfiable range: {value}")
 
+    return begin, end
 
-@app.get("/photo-events")
-async def photo_events_api():
-    """Events from camera.
-    """
-    result = {"data": {
-        dt.isoformat(): value
-        for value, dt in app.current_state["image_events"]
-    }}
-    app.current_state["image_events"].clear()
-    return result
+
+@app.get("/clips")
+@app.get("/cameras/{camera}/clips")
+async def clips_api(camera: typing.Optional[str] = None):
+    """Clips of camera events (of all cameras by default): name, size,
+    number of frames, time of the first and the last frame.
+    """
+    if camera is not None:
+        get_camera(camera)
+
+    result = []
+    for name in clip_names():
+        try:
+            info = read_clip_index(name)
+        except Exception as err:
+            logger.error(f"Clip {name} index error: {err}")
+            continue
+
+        if camera is not None and info.get("camera") != camera:
+            continue
+
+        frames = info["frames"]
+        result.append({
+            "name": name,
+            "camera": info.get("camera"),
+            "size": info["size"],
+            "frames": len(frames),
+            "begin": frames[0]["dt"] if frames else None,
+            "end": frames[-1]["dt"] if frames else None,
+        })
+
+    return {"clips": result}
+
+
+def check_clip_name(name: str):
+    if not clip_name_rx.match(name) or name not in clip_names():
+        raise HTTPException(status_code=404, detail="Clip not found")
+
+
+@app.get("/clips/{name}.json")
+async def clip_index_api(name: str):
+    """Offsets and sizes of JPEG frames of clip.
+    """
+    check_clip_name(name)
+    return read_clip_index(name)
+
+
+@app.get("/clips/{name}.mjpeg")
+async def clip_api(
+    name: str, byte_range_header: typing.Optional[str] = Header(
+        None, alias="Range"
+    )
+):
+    """Clip file (concatenated JPEG frames),
+    a part of file is read by Range header.
+    """
+    check_clip_name(name)
+    size = os.path.getsize(clip_filepath(name))
+    try:
+        part = byte_range(byte_range_header, size)
+    except ValueError as err:
+        return Response(
+            str(err),
+            status_code=416,
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+
+    begin, end = part or (0, size)
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(None, read_clip_range, name, begin, end)
+    headers = {"Accept-Ranges": "bytes"}
+    if part:
+        headers["Content-Range"] = f"bytes {begin}-{end - 1}/{size}"
+
+    return Response(
+        data,
+        status_code=206 if part else 200,
+        media_type="video/x-motion-jpeg",
+        headers=headers
+    )
+
+
+@app.get("/clips/{name}/{frame}.jpeg")
+async def clip_frame_api(name: str, frame: int):
+    """One frame of clip.
+    """
+    check_clip_name(name)
+    frames = read_clip_index(name)["frames"]
+    if not 0 <= frame < len(frames):
+        raise HTTPException(status_code=404, detail="Frame not found")
+
+    offset = frames[frame]["offset"]
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(
+        None, read_clip_range, name, offset, offset + frames[frame]["size"]
+    )
+    return Response(data, media_type="image/jpeg")
 
 
 @app.post("/gpio")
@@ -0,0 +1,126 @@
+import typing
+
+import numpy as np
+
+from .helpers import env_var_float
+from .helpers import env_var_int
+
+# brightness of spot pixels (for values in [0..1])
+IMG_SPOT_LIMIT = env_var_float("IMG_SPOT_LIMIT") or 0.85
+# the least spot in pixels of area
+IMG_SPOT_MIN_AREA = env_var_int("IMG_SPOT_MIN_AREA") or 4
+# the largest spots in answer
+IMG_SPOT_MAX_COUNT = env_var_int("IMG_SPOT_MAX_COUNT") or 16
+
+Spot = typing.Dict[str, float]
+
+
+def find_runs(mask: np.ndarray) -> typing.Tuple[np.ndarray, ...]:
+    """Horizontal runs of True values: rows, starts and ends (exclusive),
+    runs are ordered by row and start.
+    """
+    h, w = mask.shape
+    padded = np.zeros((h, w + 2), dtype="i1")
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return rows, starts, ends
+
+
+def link_runs(
+    rows: np.ndarray, starts: np.ndarray, ends: np.ndarray, width: int
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Pairs of runs which are connected (8-connectivity) with a run
+    of the next row. Runs of the next row which overlap a run
+    are a continuous range in order of runs, so the ranges are
+    found by binary search.
+    """
+    key = width + 2
+    start_keys = rows * key + starts
+    end_keys = rows * key + ends
+    next_row = (rows + 1) * key
+    # the first run with end >= start (diagonal neighbour is connected)
+    lo = np.searchsorted(end_keys, next_row + starts, side="left")
+    # runs with start <= end
+    hi = np.searchsorted(start_keys, next_row + ends, side="right")
+    counts = np.maximum(hi - lo, 0)
+    total = int(counts.sum())
+    first = np.repeat(np.arange(len(rows)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    second = np.repeat(lo, counts) + offsets
+    return first, second
+
+
+def label_runs(n: int, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Component of each run: union-find with vectorized steps,
+    the least index of run is the label of component.
+    """
+    labels = np.arange(n)
+    while True:
+        least = np.minimum(labels[first], labels[second])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, first, least)
+        np.minimum.at(new_labels, second, least)
+        # path compression
+        while True:
+            parents = new_labels[new_labels]
+            if np.array_equal(parents, new_labels):
+                break
+
+            new_labels = parents
+
+        if np.array_equal(new_labels, labels):
+            return labels
+
+        labels = new_labels
+
+
+def detect_spots(
+    area: np.ndarray,
+    limit: float = IMG_SPOT_LIMIT,
+    min_area: int = IMG_SPOT_MIN_AREA,
+    max_count: int = IMG_SPOT_MAX_COUNT,
+    scale: typing.Tuple[float, float] = (1, 1),
+    analysed: typing.Optional[np.ndarray] = None
+) -> typing.List[Spot]:
+    """Bright spots of area (values in [0..1]): centroid (x, y) and
+    size in pixels of frame (area is scaled by scale y, x),
+    mean intensity. The largest spots first.
+    Only the analysed pixels (mask of area) are labelled.
+    """
+    mask = area > limit
+    if analysed is not None:
+        mask &= analysed
+
+    rows, starts, ends = find_runs(mask)
+    if not len(rows):
+        return []
+
+    h, w = area.shape
+    first, second = link_runs(rows, starts, ends, w)
+    labels = label_runs(len(rows), first, second)
+    components, index = np.unique(labels, return_inverse=True)
+    lengths = (ends - starts).astype("f8")
+    sizes = np.bincount(index, weights=lengths)
+    # sums of values in runs by cumulative sums of rows
+    sums = np.zeros((h, w + 1), dtype="f8")
+    np.cumsum(area, axis=1, out=sums[:, 1:])
+    intensity = np.bincount(
+        index, weights=sums[rows, ends] - sums[rows, starts]
+    )
+    x = np.bincount(index, weights=lengths * (starts + ends - 1) / 2)
+    y = np.bincount(index, weights=lengths * rows)
+
+    selected = np.flatnonzero(sizes >= min_area)
+    selected = selected[np.argsort(-sizes[selected], kind="stable")]
+    scale_y, scale_x = scale
+    return [
+        {
+            "x": round(float(x[i] / sizes[i] + 0.5) * scale_x, 1),
+            "y": round(float(y[i] / sizes[i] + 0.5) * scale_y, 1),
+            "area": round(float(sizes[i]) * scale_x * scale_y, 1),
+            "intensity": round(float(intensity[i] / sizes[i]), 3),
+        }
+        for i in selected[:max_count]
+    ]
@@ -0,0 +1,450 @@
+import lzma
+import os
+import re
+import shutil
+import typing
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+
+import numpy as np
+
+from .helpers import current_date
+
+# epoch timestamp (local time) + value
+RECORD = np.dtype([("ts", "<u4"), ("value", "<f4")])
+# aggregates of values in time bucket which begins at "ts"
+ROLLUP = np.dtype([
+    ("ts", "<u4"),
+    ("min", "<f4"),
+    ("max", "<f4"),
+    ("mean", "<f4"),
+    ("count", "<u4"),
+])
+EPOCH = datetime(1970, 1, 1)
+# closed months are compressed by xz with delta filter by record size
+COMPRESSED_EXT = "xz"
+# records in one part of reading
+READ_CHUNK = 64 * 1024
+
+
+def to_timestamp(dt: typing.Union[date, datetime]) -> int:
+    """Local datetime as seconds from the epoch (without time zone).
+    """
+    if not isinstance(dt, datetime):
+        dt = datetime.combine(dt, datetime.min.time())
+
+    return int((dt - EPOCH).total_seconds())
+
+
+def iter_months(begin: date, end: date) -> typing.Iterator[date]:
+    """First days of months in interval [begin..end].
+    """
+    month = begin.replace(day=1)
+    while month <= end:
+        yield month
+        month = (month + timedelta(days=31)).replace(day=1)
+
+
+class SeriesStorage:
+    """Append-only storage of fixed width records in month files.
+    Records are sorted by the field "ts" so reading of an interval
+    is a binary search in memory-mapped file.
+    """
+    path: str
+    prefix: str
+    ext: str
+    dtype: np.dtype
+    last_ts: typing.Dict[str, int]
+    name_rx: typing.Pattern
+
+    def __init__(
+        self,
+        path: str,
+        prefix: str = "month_t",
+        dtype: np.dtype = RECORD,
+        ext: str = "bin"
+    ):
+        self.path = path
+        self.prefix = prefix
+        self.dtype = dtype
+        self.ext = ext
+        self.last_ts = {}
+        self.name_rx = re.compile(
+            r"^{}_(\d{{4}}-\d{{2}})\.{}(\.{})?$".format(
+                re.escape(prefix), re.escape(ext), COMPRESSED_EXT
+            )
+        )
+
+    def filepath(self, dt: typing.Union[date, datetime, None] = None) -> str:
+        """Path of month file.
+        """
+        dt = dt or current_date()
+        return os.path.join(
+            self.path, f"{self.prefix}_{dt.year:04d}-{dt.month:02d}.{self.ext}"
+        )
+
+    def month_path(self, month: date) -> typing.Optional[str]:
+        """Path of exists month file (compressed or not).
+        """
+        filepath = self.filepath(month)
+        for path in (filepath, f"{filepath}.{COMPRESSED_EXT}"):
+            if os.path.exists(path):
+                return path
+
+        return None
+
+    def is_closed(self, filepath: str) -> bool:
+        """The month of file is compressed and can't be changed
+        (the path is the compressed file or the file has compressed copy).
+        """
+        return filepath.endswith(f".{COMPRESSED_EXT}") or os.path.exists(
+            f"{filepath}.{COMPRESSED_EXT}"
+        )
+
+    def files(self) -> typing.List[str]:
+        """Exists month files (compressed or not) from old to new.
+        """
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            names = []
+
+        return [
+            os.path.join(self.path, name)
+            for name in sorted(names)
+            if self.name_rx.match(name)
+        ]
+
+    def file_month(self, filepath: str) -> date:
+        """The first day of month of file.
+        """
+        search = self.name_rx.match(os.path.basename(filepath))
+        return date.fromisoformat(f"{search.group(1)}-01")
+
+    def size(self) -> int:
+        """Size of all files in bytes.
+        """
+        return sum(map(os.path.getsize, self.files()))
+
+    def last_record(self, filepath: str) -> typing.Optional[np.ndarray]:
+        """The last record of file.
+        """
+        size = self.dtype.itemsize
+        try:
+            with open(filepath, "rb") as src:
+                src.seek(0, os.SEEK_END)
+                if src.tell() < size:
+                    return None
+
+                src.seek(-size, os.SEEK_END)
+                data = src.read(size)
+        except FileNotFoundError:
+            return None
+
+        return np.frombuffer(data, dtype=self.dtype)[0]
+
+    def insert(self, filepath: str, record: np.ndarray):
+        """Write record to its place by time, the newer records
+        are moved to the end of file.
+        """
+        records = np.fromfile(filepath, dtype=self.dtype)
+        index = int(np.searchsorted(records["ts"], record["ts"], "right"))
+        with open(filepath, "r+b") as out:
+            out.seek(index * self.dtype.itemsize)
+            out.write(record.tobytes())
+            out.write(records[index:].tobytes())
+
+    def append(self, dt: datetime, value: float) -> bool:
+        """Add record to end of month file.
+        Records older than the last one (system clock changes, the repeated
+        hour of daylight saving time) are merged in to keep the file sorted.
+        """
+        filepath = self.filepath(dt)
+        ts = to_timestamp(dt)
+        if self.is_closed(filepath):
+            return False
+
+        if filepath not in self.last_ts:
+            last = self.last_record(filepath)
+            self.last_ts[filepath] = -1 if last is None else int(last["ts"])
+
+        record = np.array([(ts, value)], dtype=self.dtype)[0]
+        if ts < self.last_ts[filepath]:
+            self.insert(filepath, record)
+            return True
+
+        with open(filepath, "ab") as out:
+            out.write(record.tobytes())
+
+        self.last_ts[filepath] = ts
+        return True
+
+    def write(self, month: date, records: np.ndarray):
+        """Replace data of month file by records.
+        """
+        filepath = self.filepath(month)
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, "wb") as out:
+            out.write(np.ascontiguousarray(records, self.dtype).tobytes())
+
+        os.replace(tmp_path, filepath)
+        self.last_ts.pop(filepath, None)
+        if self.is_closed(filepath):
+            os.remove(f"{filepath}.{COMPRESSED_EXT}")
+
+    def compress(self, month: date) -> int:
+        """Compress the month file, returns size of compressed file.
+        """
+        filepath = self.filepath(month)
+        target = f"{filepath}.{COMPRESSED_EXT}"
+        tmp_path = f"{target}.tmp"
+        filters = [
+            {"id": lzma.FILTER_DELTA, "dist": self.dtype.itemsize},
+            {"id": lzma.FILTER_LZMA2, "preset": 9, "dict_size": 1 << 20},
+        ]
+        with open(filepath, "rb") as src:
+            with lzma.open(tmp_path, "wb", filters=filters) as out:
+                shutil.copyfileobj(src, out)
+
+        os.replace(tmp_path, target)
+        os.remove(filepath)
+        self.last_ts.pop(filepath, None)
+        return os.path.getsize(target)
+
+    def iter_compressed_file(
+        self, filepath: str, begin: int, end: int, chunk: int = READ_CHUNK
+    ) -> typing.Iterator[np.ndarray]:
+        """Parts of records in interval [begin..end) of timestamps
+        from compressed file, the file is decompressed as stream.
+        """
+        itemsize = self.dtype.itemsize
+        tail = b""
+        with lzma.open(filepath, "rb") as src:
+            while True:
+                data = src.read(chunk * itemsize)
+                if not data:
+                    break
+
+                data = tail + data
+                size = len(data) - len(data) % itemsize
+                tail = data[size:]
+                part = np.frombuffer(data[:size], dtype=self.dtype)
+                ts = part["ts"]
+                if len(ts) == 0 or ts[-1] < begin:
+                    continue
+
+                first = np.searchsorted(ts, begin, side="left")
+                last = np.searchsorted(ts, end, side="left")
+                if first < last:
+                    yield part[first:last]
+
+                if last < len(part):
+                    break
+
+    def iter_file(
+        self, filepath: str, begin: int, end: int, chunk: int = READ_CHUNK
+    ) -> typing.Iterator[np.ndarray]:
+        """Parts of records in interval [begin..end) of timestamps.
+        """
+        if filepath.endswith(f".{COMPRESSED_EXT}"):
+            yield from self.iter_compressed_file(filepath, begin, end, chunk)
+            return
+
+        size = os.path.getsize(filepath) // self.dtype.itemsize
+        if size == 0:
+            return
+
+        data = np.memmap(filepath, dtype=self.dtype, mode="r", shape=(size,))
+        try:
+            ts = data["ts"]
+            first = np.searchsorted(ts, begin, side="left")
+            last = np.searchsorted(ts, end, side="left")
+            for index in range(first, last, chunk):
+                yield np.array(data[index:min(index + chunk, last)])
+        finally:
+            del data
+
+    def iter_read(
+        self,
+        begin: typing.Union[date, datetime],
+        end: typing.Union[date, datetime],
+        chunk: int = READ_CHUNK
+    ) -> typing.Iterator[np.ndarray]:
+        """Parts of records in time interval [begin..end).
+        """
+        begin_ts = to_timestamp(begin)
+        end_ts = to_timestamp(end)
+        end_day = end.date() if isinstance(end, datetime) else end
+        begin_day = begin.date() if isinstance(begin, datetime) else begin
+        for month in iter_months(begin_day, end_day):
+            filepath = self.month_path(month)
+            if filepath:
+                yield from self.iter_file(filepath, begin_ts, end_ts, chunk)
+
+    def read(
+        self,
+        begin: typing.Union[date, datetime],
+        end: typing.Union[date, datetime]
+    ) -> np.ndarray:
+        """Records in time interval [begin..end).
+        """
+        parts = list(self.iter_read(begin, end))
+        if not parts:
+            return np.empty(0, dtype=self.dtype)
+        elif len(parts) == 1:
+            result, *_ = parts
+            return result
+
+        return np.concatenate(parts)
+
+
+def bucket_index(ts: np.ndarray, step: int) -> np.ndarray:
+    """Indexes of the first records in time buckets of sorted timestamps.
+    """
+    buckets = ts - ts % step
+    return np.concatenate([[0], np.flatnonzero(np.diff(buckets)) + 1])
+
+
+def aggregate(ts: np.ndarray, values: np.ndarray, step: int) -> np.ndarray:
+    """Group sorted values by time buckets with size "step" in seconds.
+    """
+    if len(ts) == 0:
+        return np.empty(0, dtype=ROLLUP)
+
+    index = bucket_index(ts, step)
+    result = np.empty(len(index), dtype=ROLLUP)
+    result["ts"] = ts[index] - ts[index] % step
+    result["min"] = np.minimum.reduceat(values, index)
+    result["max"] = np.maximum.reduceat(values, index)
+    result["count"] = np.diff(np.append(index, len(ts)))
+    result["mean"] = (
+        np.add.reduceat(values.astype("f8"), index) / result["count"]
+    )
+    return result
+
+
+def regroup(records: np.ndarray, step: int) -> np.ndarray:
+    """Group aggregates to bigger time buckets.
+    """
+    if len(records) == 0:
+        return np.empty(0, dtype=ROLLUP)
+
+    ts = records["ts"]
+    index = bucket_index(ts, step)
+    result = np.empty(len(index), dtype=ROLLUP)
+    result["ts"] = ts[index] - ts[index] % step
+    result["min"] = np.minimum.reduceat(records["min"], index)
+    result["max"] = np.maximum.reduceat(records["max"], index)
+    result["count"] = np.add.reduceat(records["count"], index)
+    weighted = records["mean"].astype("f8") * records["count"]
+    result["mean"] = np.add.reduceat(weighted, index) / result["count"]
+    return result
+
+
+class RollupStorage(SeriesStorage):
+    """Aggregates of values by time buckets (minute, hour, day, ..)
+    which are updated by each new value.
+    """
+    name: str
+    step: int
+    current: typing.Optional[np.ndarray]
+    current_path: str
+
+    def __init__(
+        self,
+        path: str,
+        name: str,
+        step: int,
+        prefix: str = "month_t"
+    ):
+        super().__init__(path, prefix, ROLLUP, f"{name}.bin")
+        self.name = name
+        self.step = step
+        self.current = None
+        self.current_path = ""
+
+    def append(self, dt: datetime, value: float) -> bool:
+        """Update the bucket of time or create new one.
+        """
+        filepath = self.filepath(dt)
+        ts = to_timestamp(dt)
+        bucket = ts - ts % self.step
+        if self.is_closed(filepath):
+            return False
+
+        if filepath != self.current_path:
+            self.current = self.last_record(filepath)
+            self.current_path = filepath
+
+        current = self.current
+        if current is None or current["ts"] < bucket:
+            current = self.new_bucket(bucket, value)
+            mode = "ab"
+        elif current["ts"] == bucket:
+            current = self.add_value(current, value)
+            mode = "r+b"
+        else:
+            self.merge(filepath, bucket, value)
+            return True
+
+        with open(filepath, mode) as out:
+            if mode == "r+b":
+                out.seek(-self.dtype.itemsize, os.SEEK_END)
+
+            out.write(current.tobytes())
+
+        self.current = current
+        return True
+
+    def new_bucket(self, bucket: int, value: float) -> np.ndarray:
+        return np.array(
+            [(bucket, value, value, value, 1)], dtype=self.dtype
+        )[0]
+
+    def add_value(self, record: np.ndarray, value: float) -> np.ndarray:
+        """Copy of the aggregates with the value.
+        """
+        record = record.copy()
+        count = int(record["count"]) + 1
+        record["min"] = min(record["min"], value)
+        record["max"] = max(record["max"], value)
+        record["mean"] += (value - record["mean"]) / count
+        record["count"] = count
+        return record
+
+    def merge(self, filepath: str, bucket: int, value: float):
+        """Update the bucket older than the last one (or create it).
+        """
+        records = np.fromfile(filepath, dtype=self.dtype)
+        index = int(np.searchsorted(records["ts"], bucket))
+        if index < len(records) and records["ts"][index] == bucket:
+            with open(filepath, "r+b") as out:
+                out.seek(index * self.dtype.itemsize)
+                out.write(self.add_value(records[index], value).tobytes())
+        else:
+            self.insert(filepath, self.new_bucket(bucket, value))
+
+    def write(self, month: date, records: np.ndarray):
+        """Replace data of month file by records.
+        """
+        super().write(month, records)
+        self.current_path = ""
+
+    def compress(self, month: date) -> int:
+        """Compress the month file, returns size of compressed file.
+        """
+        result = super().compress(month)
+        self.current_path = ""
+        return result
+
+    def build(self, source: SeriesStorage, month: date) -> int:
+        """Create the month aggregates from source storage of values.
+        """
+        begin = month.replace(day=1)
+        records = source.read(
+            begin, (begin + timedelta(days=31)).replace(day=1)
+        )
+        data = aggregate(records["ts"], records["value"], self.step)
+        self.write(begin, data)
+        return len(data)
@@ -1,36 +1,87 @@
 import asyncio
+import glob
 import logging
 import os
+import re
 import typing
 from datetime import date
 from datetime import datetime
 from datetime import timedelta
 
+import numpy as np
 import pandas as pd
 
 from .helpers import current_date
 from .helpers import current_datetime
+from .helpers import current_time
 from .helpers import env_var_int
 from .helpers import env_var_line
 from .helpers import env_var_time
+from .storage import READ_CHUNK
+from .storage import RollupStorage
+from .storage import SeriesStorage
+from .storage import regroup
 
 TEMPERATURE_STORAGE = env_var_line("TEMPERATURE_STORAGE") or "/data/temperature"  # noqa
 # in mb default 150 mb
 TEMPERATURE_STORAGE_MAX_SIZE = env_var_int("TEMPERATURE_STORAGE_MAX_SIZE") or 150  # noqa
-# sensor
-TEMPERATURE_DEVICE = env_var_line("TEMPERATURE_DEVICE") or "/sys/bus/w1/devices/w1_bus_master1/28-fc6db0116461/w1_slave"  # noqa
+# sensors
+# the old setting of one sensor: path of its w1_slave file
+TEMPERATURE_DEVICE = env_var_line("TEMPERATURE_DEVICE")
+W1_BUS_PATH = env_var_line("W1_BUS_PATH") or os.path.dirname(os.path.dirname(TEMPERATURE_DEVICE)) or "/sys/bus/w1/devices/w1_bus_master1"  # noqa
+# the main sensor: default for API and owner of the old storage files
+TEMPERATURE_SENSOR = env_var_line("TEMPERATURE_SENSOR") or os.path.basename(os.path.dirname(TEMPERATURE_DEVICE)) or "28-fc6db0116461"  # noqa
 TEMPERATURE_READ_INTERVAL = env_var_time("TEMPERATURE_READ_INTERVAL") or 30  # noqa
+TEMPERATURE_SAMPLE_INTERVAL = env_var_time("TEMPERATURE_SAMPLE_INTERVAL") or 10  # noqa
+# the last sensor value is too old after that time
+TEMPERATURE_STALE_TIME = 3 * TEMPERATURE_SAMPLE_INTERVAL
+# sensor resolution 9..12 bits (0 - do not change)
+TEMPERATURE_RESOLUTION = env_var_int("TEMPERATURE_RESOLUTION")
 logger = logging.getLogger(env_var_line("LOGGER") or "uvicorn.asgi")
+# rollup tiers: name and size of time bucket in seconds
+TEMPERATURE_TIERS = (("1min", 60), ("1h", 3600), ("1d", 3600 * 24))
+sensor_rx = re.compile(r"^28-[0-9a-f]+$")
 
 
-def read_temperature() -> typing.Optional[float]:
+def discover_sensors(bus_path: str = W1_BUS_PATH) -> typing.Dict[str, str]:
+    """DS18B20 sensors on 1-wire bus as sensor id and path of w1_slave.
+    """
+    pattern = os.path.join(bus_path, "28-*", "w1_slave")
+    return {
+        os.path.basename(os.path.dirname(path)): path
+        for path in sorted(glob.glob(pattern))
+    }
+
+
+def trigger_conversion(bus_path: str = W1_BUS_PATH) -> bool:
+    """Start conversion on all sensors of bus at once (w1_therm bulk read),
+    after that the reading of each sensor doesn't wait for conversion.
+    """
+    filepath = os.path.join(bus_path, "therm_bulk_read")
+    if not os.path.exists(filepath):
+        return False
+
+    try:
+        with open(filepath, "w") as out:
+            out.write("trigger")
+    except Exception as err:
+        logger.error(f"Bulk conversion error: {err}")
+        return False
+
+    return True
+
+
+def read_temperature(
+    device: str = os.path.join(W1_BUS_PATH, TEMPERATURE_SENSOR, "w1_slave")
+) -> typing.Optional[float]:
     """Get the current temperature value in C.
+    It is blocking call (conversion time of sensor up to 750 ms).
         73 01 ff ff 7f ff ff ff 86 : crc=86 YES
         73 01 ff ff 7f ff ff ff 86 t=23187
     """
     result = None
     try:
-        with open(TEMPERATURE_DEVICE) as t_file:
+        with open(device) as t_file:
             data = t_file.read()
         for part in data.split():
             if "t=" in part:
@@ -42,62 +93,463 @@ def read_temperature() -> typing.Optional[float]:
     return result
 
 
-def current_temperature_filepath(
-    dt: typing.Union[date, datetime, None] = None
-) -> str:
-    file_name, *_ = (dt or current_date()).isoformat().rsplit("-", 1)
-    return os.path.join(
-        TEMPERATURE_STORAGE, f"month_t_{file_name}.csv"
+def conversion_time(resolution: int) -> float:
+    """Conversion time of DS18B20 in seconds for resolution in bits.
+    """
+    return 0.09375 * 2 ** (min(max(resolution, 9), 12) - 9)
+
+
+def set_sensor_resolution(resolution: int, device: str) -> bool:
+    """Set resolution 9..12 bits by the w1_therm driver.
+    """
+    filepath = os.path.join(os.path.dirname(device), "resolution")
+    try:
+        with open(filepath, "w") as out:
+            out.write(f"{resolution}")
+    except Exception as err:
+        logger.error(f"Sensor resolution {resolution} error: {err}")
+        return False
+
+    return True
+
+
+class TemperatureSampler:
+    """Reading the sensors in threads on own cadence,
+    the last values are available for all consumers.
+    """
+    values: typing.Dict[str, float]
+    dts: typing.Dict[str, datetime]
+    updated: typing.Dict[str, float]
+    devices: typing.Dict[str, str]
+    interval: float
+    bus_path: str
+
+    def __init__(
+        self,
+        interval: float = TEMPERATURE_SAMPLE_INTERVAL,
+        bus_path: str = W1_BUS_PATH
+    ):
+        self.values = {}
+        self.dts = {}
+        self.updated = {}
+        self.devices = {}
+        self.interval = interval
+        self.bus_path = bus_path
+
+    @property
+    def sensors(self) -> typing.List[str]:
+        return sorted(self.values)
+
+    def age(self, sensor: str = TEMPERATURE_SENSOR) -> float:
+        """Time since the last value in seconds.
+        """
+        if sensor not in self.updated:
+            return float("inf")
+
+        return current_time() - self.updated[sensor]
+
+    def publish(self, sensor: str, value: typing.Optional[float]):
+        if value is None:
+            return
+
+        self.values[sensor] = value
+        self.dts[sensor] = current_datetime()
+        self.updated[sensor] = current_time()
+
+    def latest(
+        self, sensor: str = TEMPERATURE_SENSOR, max_age: float = 0
+    ) -> typing.Optional[float]:
+        """The last value if it is not older than max_age seconds.
+        """
+        if max_age and self.age(sensor) > max_age:
+            return None
+
+        return self.values.get(sensor)
+
+    async def discover(self):
+        """Update the list of sensors on bus.
+        """
+        loop = asyncio.get_running_loop()
+        devices = await loop.run_in_executor(
+            None, discover_sensors, self.bus_path
+        )
+        for sensor, device in devices.items():
+            if sensor in self.devices:
+                continue
+
+            logger.info(f"New temperature sensor: {sensor}")
+            if TEMPERATURE_RESOLUTION:
+                await loop.run_in_executor(
+                    None, set_sensor_resolution, TEMPERATURE_RESOLUTION, device
+                )
+
+        self.devices = devices
+
+    async def sample(self):
+        """Read all sensors concurrently, one cycle costs
+        one conversion time.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, trigger_conversion, self.bus_path)
+        devices = list(self.devices.items())
+        values = await asyncio.gather(*(
+            loop.run_in_executor(None, read_temperature, device)
+            for _, device in devices
+        ))
+        for (sensor, _), value in zip(devices, values):
+            if value is None:
+                logger.error(f"Sensor {sensor} value is not available")
+            else:
+                self.publish(sensor, value)
+
+    async def run(self, state: dict):
+        """Sensors reading loop.
+        """
+        if TEMPERATURE_RESOLUTION:
+            logger.info(
+                f"Sensor resolution {TEMPERATURE_RESOLUTION} bits "
+                f"({conversion_time(TEMPERATURE_RESOLUTION)} sec)"
+            )
+
+        while state.get("active"):
+            begin = current_time()
+            try:
+                await self.discover()
+                await self.sample()
+            except Exception as err:
+                logger.error(f"Sensors reading error: {err}")
+
+            await asyncio.sleep(
+                max(self.interval - (current_time() - begin), 0)
+            )
+
+
+temperature_sampler = TemperatureSampler()
+
+
+class TemperatureSeries:
+    """Stored values and rollups of one sensor.
+    """
+    sensor: str
+    storage: SeriesStorage
+    rollups: typing.List[RollupStorage]
+    # number of saved values in this process
+    version: int
+
+    def __init__(self, sensor: str, path: str = TEMPERATURE_STORAGE):
+        path = os.path.join(path, sensor)
+        self.sensor = sensor
+        self.version = 0
+        self.storage = SeriesStorage(path)
+        self.rollups = [
+            RollupStorage(path, name, step)
+            for name, step in TEMPERATURE_TIERS
+        ]
+
+    def save(self, dt: datetime, value: float) -> bool:
+        """Save record and update rollups.
+        """
+        os.makedirs(self.storage.path, exist_ok=True)
+        done = self.storage.append(dt, value)
+        if not done:
+            logger.warning(
+                f"Value of {self.sensor} at {dt} is not saved "
+                "(the month is closed)"
+            )
+            return done
+
+        self.version += 1
+        for rollup in self.rollups:
+            try:
+                rollup.append(dt, value)
+            except Exception as err:
+                logger.critical(f"Error update rollup '{rollup.name}': {err}")
+
+        return done
+
+    def build_rollups(self) -> int:
+        """Create the aggregates of months which have not them
+        (closed months had them, their tiers could be removed by limit
+        of storage). Returns number of created files.
+        """
+        n = 0
+        for filepath in self.storage.files():
+            if self.storage.is_closed(filepath):
+                continue
+
+            month = self.storage.file_month(filepath)
+            for rollup in self.rollups:
+                if rollup.month_path(month) is None:
+                    size = rollup.build(self.storage, month)
+                    logger.info(
+                        f"Rollup '{rollup.name}' of {self.sensor} "
+                        f"{month}: {size} rows"
+                    )
+                    n += 1
+
+        return n
+
+    def tier(self, resolution: float) -> typing.Optional[RollupStorage]:
+        """The coarsest rollup tier which keeps the resolution in seconds.
+        """
+        result = None
+        for rollup in self.rollups:
+            if rollup.step <= resolution:
+                result = rollup
+
+        return result
+
+    def iter_read(
+        self,
+        begin: date,
+        end: date,
+        resolution: float = 0,
+        chunk: int = READ_CHUNK
+    ) -> typing.Iterator[typing.Tuple[np.ndarray, np.ndarray]]:
+        """Parts of timestamps and values in time interval [begin..end],
+        with resolution (in seconds) the values are mean values
+        of time buckets. The memory usage doesn't depend on interval size.
+        """
+        tier = self.tier(resolution)
+        if tier is None:
+            for records in self.storage.iter_read(
+                begin, end + timedelta(1), chunk
+            ):
+                yield records["ts"], records["value"]
+
+            return
+
+        step = int(resolution)
+        tail = None
+        for records in tier.iter_read(begin, end + timedelta(1), chunk):
+            if tier.step == step:
+                yield records["ts"], records["mean"]
+                continue
+
+            # the last bucket can be continued in next part
+            if tail is not None:
+                records = np.concatenate([tail, records])
+
+            groups = regroup(records, step)
+            index = np.searchsorted(records["ts"], groups["ts"][-1])
+            tail = records[index:]
+            groups = groups[:-1]
+            if len(groups):
+                yield groups["ts"], groups["mean"]
+
+        if tail is not None and len(tail):
+            groups = regroup(tail, step)
+            yield groups["ts"], groups["mean"]
+
+    def read(
+        self, begin: date, end: date, resolution: float = 0
+    ) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Timestamps and values in time interval [begin..end].
+        """
+        parts = list(self.iter_read(begin, end, resolution))
+        if not parts:
+            return np.empty(0, dtype="u4"), np.empty(0, dtype="f4")
+
+        return (
+            np.concatenate([ts for ts, _ in parts]),
+            np.concatenate([values for _, values in parts]),
+        )
+
+
+sensors_series: typing.Dict[str, TemperatureSeries] = {}
+
+
+def temperature_series(
+    sensor: typing.Optional[str] = None
+) -> TemperatureSeries:
+    """Storage of sensor values (the main sensor by default).
+    """
+    sensor = sensor or TEMPERATURE_SENSOR
+    if not sensor_rx.match(sensor):
+        raise ValueError(f"Wrong sensor id: {sensor}")
+
+    if sensor not in sensors_series:
+        sensors_series[sensor] = TemperatureSeries(sensor)
+
+    return sensors_series[sensor]
+
+
+def stored_sensors() -> typing.List[str]:
+    """Sensors which have data in storage.
+    """
+    try:
+        names = os.listdir(TEMPERATURE_STORAGE)
+    except FileNotFoundError:
+        names = []
+
+    return sorted(
+        name for name in names
+        if sensor_rx.match(name)
+        and os.path.isdir(os.path.join(TEMPERATURE_STORAGE, name))
     )
 
 
-def save_tempearture() -> bool:
+def save_tempearture(
+    value: typing.Optional[float], sensor: str = TEMPERATURE_SENSOR
+) -> bool:
     """Save record to file.
     """
-    value = read_temperature()
     if value is None:
-        logger.error(f"Sensor value: {value}")
+        logger.error(f"Sensor {sensor} value: {value}")
         return False
 
-    filepath = current_temperature_filepath()
+    dt = current_datetime()
+    series = temperature_series(sensor)
     try:
-        with open(filepath, "a") as out:
-            out.write(f"{current_datetime()},{value:0.2f}\n")
+        done = series.save(dt, value)
     except Exception as err:
         logger.critical(
-            f"Error write value in '{filepath}': {err}"
+            f"Error write value in '{series.storage.filepath(dt)}': {err}"
         )
         return False
 
-    return True
+    return done
+
+
+def migrate_storage() -> int:
+    """Convert the text month files (month_t_YYYY-MM.csv) to binary format
+    and move files from the root of storage to the main sensor directory.
+    Returns number of converted files.
+    """
+    series = temperature_series()
+    os.makedirs(series.storage.path, exist_ok=True)
+    for legacy in [SeriesStorage(TEMPERATURE_STORAGE)] + [
+        RollupStorage(TEMPERATURE_STORAGE, name, step)
+        for name, step in TEMPERATURE_TIERS
+    ]:
+        for filepath in legacy.files():
+            target = os.path.join(
+                series.storage.path, os.path.basename(filepath)
+            )
+            if not os.path.exists(target):
+                os.replace(filepath, target)
+                logger.warning(f"Temperature file '{filepath}' moved")
+
+    storage = series.storage
+    csv_storage = SeriesStorage(TEMPERATURE_STORAGE, ext="csv")
+    n = 0
+    for filepath in csv_storage.files():
+        part = pd.read_csv(filepath, header=None, names=["dt", "value"])
+        part.dt = pd.to_datetime(part.dt, errors="coerce")
+        part.value = pd.to_numeric(part.value, errors="coerce")
+        part.dropna(inplace=True)
+        if len(part) == 0:
+            os.remove(filepath)
+            continue
+
+        month = part.dt.iloc[0].date()
+        records = np.empty(len(part), dtype=storage.dtype)
+        records["ts"] = (
+            part.dt.values.astype("datetime64[s]").astype("int64")
+        )
+        records["value"] = part.value.values
+        begin = month.replace(day=1)
+        exists = storage.read(
+            begin, (begin + timedelta(days=31)).replace(day=1)
+        )
+        if len(exists):
+            records = np.concatenate([records, exists])
+
+        records.sort(order="ts", kind="stable")
+        storage.write(month, records)
+        os.remove(filepath)
+        logger.warning(
+            f"Temperature file '{filepath}' converted: {len(records)} rows"
+        )
+        n += 1
+
+    return n
+
+
+def build_rollups() -> int:
+    """Create the aggregates of months which have not them
+    for all sensors. Returns number of created files.
+    """
+    return sum(
+        temperature_series(sensor).build_rollups()
+        for sensor in stored_sensors()
+    )
+
+
+def compress_tempearture_storage() -> int:
+    """Compress files of closed months (before current month)
+    for all sensors. Returns number of compressed files.
+    """
+    current_month = current_date().replace(day=1)
+    n = 0
+    for sensor in stored_sensors():
+        series = temperature_series(sensor)
+        for storage in [series.storage] + series.rollups:
+            for filepath in storage.files():
+                month = storage.file_month(filepath)
+                if month >= current_month or storage.is_closed(filepath):
+                    continue
+
+                try:
+                    size = os.path.getsize(filepath)
+                    compressed_size = storage.compress(month)
+                except Exception as err:
+                    logger.error(
+                        f"Temperature file '{filepath}' compression error: "
+                        f"{err}"
+                    )
+                    continue
+
+                logger.info(
+                    f"Temperature file '{filepath}' compressed: "
+                    f"{size} -> {compressed_size} bytes"
+                )
+                n += 1
+
+    return n
 
 
 def clear_tempearture_storage():
-    """Remove old files.
+    """Remove old files (the size of compressed months is their real size).
+    The raw values and the minute aggregates are removed first,
+    the aggregates of hours and days are kept as long as possible.
     """
-    one_month = timedelta(days=31)
-    files = []
-    dt = current_datetime()
-    exists_file = True
-    while exists_file:
-        file_path = current_temperature_filepath(dt)
-        dt -= one_month
-        exists_file = os.path.exists(file_path)
-        if exists_file:
-            files.append(file_path)
-
-    files.reverse()
-    logger.info(f"Files in storage: {len(files)}")
-    size = TEMPERATURE_STORAGE_MAX_SIZE + 1
-    while files and size > TEMPERATURE_STORAGE_MAX_SIZE:
-        size = sum(map(os.path.getsize, files)) / (1024 ** 2)
-        if size > TEMPERATURE_STORAGE_MAX_SIZE:
-            old_filepath, *_ = files
-            files = files[1:]
+    all_series = list(map(temperature_series, stored_sensors()))
+    # the raw values and the minute aggregates of month are removed
+    # together, so the minute tier isn't built again from the raw values
+    months = {}
+    for series in all_series:
+        for storage in (series.storage, series.rollups[0]):
+            for filepath in storage.files():
+                key = storage.file_month(filepath), series.sensor
+                months.setdefault(key, []).append(filepath)
+
+    groups = [months[key] for key in sorted(months)]
+    for index in range(1, len(TEMPERATURE_TIERS)):
+        groups.extend(
+            [filepath]
+            for filepath in sorted(
+                (
+                    filepath
+                    for series in all_series
+                    for filepath in series.rollups[index].files()
+                ),
+                key=os.path.basename
+            )
+        )
+
+    logger.info(f"Files in storage: {sum(map(len, groups))}")
+    size = sum(
+        os.path.getsize(filepath) for group in groups for filepath in group
+    ) / (1024 ** 2)
+    while groups and size > TEMPERATURE_STORAGE_MAX_SIZE:
+        group, *groups = groups
+        for old_filepath in group:
             logger.warning(f"Delete old temperature file '{old_filepath}'")
+            size -= os.path.getsize(old_filepath) / (1024 ** 2)
             os.remove(old_filepath)
-        else:
-            logger.info(f"Current temperature storage size: {size}")
+
+    logger.info(f"Current temperature storage size: {size}")
 
 
 def cpu_temperature() -> float:
@@ -114,33 +566,38 @@ def cpu_temperature() -> float:
     return cpu_t
 
 
+def resample_seconds(resample: str) -> float:
+    """Size of time interval as pandas offset ("30s", "60min", "1D")
+    in seconds.
+    """
+    return pd.to_timedelta(resample).total_seconds()
+
+
 def read_temperature_history(
-    begin: date, end: date
+    begin: date,
+    end: date,
+    resolution: float = 0,
+    sensor: typing.Optional[str] = None
 ) -> pd.DataFrame:
-    """Temperature in time interval as DataFrame
-    """
-    this_m = begin
-    to_next = True
-    data = []
-    while to_next:
-        filepath = current_temperature_filepath(this_m)
-        this_m = this_m.replace(day=1) + timedelta(days=31)
-        to_next = this_m < end
-        if os.path.exists(filepath):
-            part = pd.read_csv(filepath)
-            part.columns = ["dt", "value"]
-            data.append(part)
-
-    n = len(data)
-    if n == 0:
-        result = pd.DataFrame(data=[], columns=["dt", "value"])
-    elif n == 1:
-        result, *_ = data
-    else:
-        result: pd.DataFrame = pd.concat(data, ignore_index=True)
-
-    result.dt = result.dt.astype("datetime64")
-    data.clear()
-    result = result[(result.dt >= begin) & (result.dt < end + timedelta(1))]
-    result.sort_values("dt", inplace=True)
-    return result
+    """Temperature in time interval as DataFrame,
+    with resolution (in seconds) the values are mean values of time buckets.
+    """
+    ts, values = temperature_series(sensor).read(begin, end, resolution)
+    return pd.DataFrame({
+        "dt": pd.to_datetime(ts, unit="s"),
+        "value": values.astype("float64"),
+    })
+
+
+def iter_temperature_history(
+    begin: date,
+    end: date,
+    resolution: float = 0,
+    sensor: typing.Optional[str] = None,
+    chunk: int = READ_CHUNK
+) -> typing.Iterator[typing.Tuple[np.ndarray, np.ndarray]]:
+    """Temperature in time interval as parts of timestamps and values.
+    """
+    return temperature_series(sensor).iter_read(
+        begin, end, resolution, chunk
+    )
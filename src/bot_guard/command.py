@@ -7,6 +7,7 @@ from aiogram.types.user import User
 
 from .const import NOT_ACCESS_ERROR
 from .helpers import env_var_bool
+from .helpers import env_var_int
 from .helpers import env_var_line
 from .helpers import env_var_list
 from .storage import BaseStorage
@@ -18,6 +19,14 @@ LAST_IMG_URI = env_var_line("LAST_IMG_URI") or "last_img.png"
 RESTART_API_URI = env_var_line("RESTART_API_URI") or "restart-service"
 PHOTO_URI = env_var_line("PHOTO_URI") or "photo.png"
 NO_LAST_IMG = env_var_bool("NO_LAST_IMG")
+# images over slow connection: jpeg, webp or png,
+# quality 1..100 and the longest side in pixels (original size if empty)
+PHOTO_FORMAT = env_var_line("PHOTO_FORMAT") or "jpeg"
+PHOTO_QUALITY = env_var_int("PHOTO_QUALITY") or 80
+PHOTO_MAX_SIZE = env_var_int("PHOTO_MAX_SIZE")
+TEMP_IMG_FORMAT = env_var_line("TEMP_IMG_FORMAT") or "jpeg"
+# width x height of chart
+TEMP_IMG_SIZE = env_var_line("TEMP_IMG_SIZE") or "640x480"
 
 GPIO_SCHEDULE_API_URI = (
     env_var_line("GPIO_SCHEDULE_API_URI") or "gpio-schedule"
@@ -47,6 +56,9 @@ class CommandHandler:
     photo_api_url: str
     last_img_url: str
     restart_api_url: str
+    image_params: typing.Dict[str, typing.Union[str, int]]
+    # image of changed region of the last photo event
+    photo_event_crop_url: typing.Optional[str]
 
     def __init__(
         self,
@@ -67,6 +79,14 @@ class CommandHandler:
         self.photo_api_url = urljoin(self.api_host, PHOTO_URI)
         self.last_img_url = urljoin(self.api_host, LAST_IMG_URI)
         self.restart_api_url = urljoin(self.api_host, RESTART_API_URI)
+        self.image_params = {
+            "format": PHOTO_FORMAT,
+            "quality": PHOTO_QUALITY,
+        }
+        if PHOTO_MAX_SIZE:
+            self.image_params["max_size"] = PHOTO_MAX_SIZE
+
+        self.photo_event_crop_url = None
 
     def access_check(self, method: typing.Callable) -> typing.Callable:
         """Decorator for checking the access.
@@ -134,7 +154,14 @@ class CommandHandler:
         try:
             async with aiohttp.ClientSession() as session:
                 async with session.post(
-                    url, json={"begin": begin, "end": end}
+                    url,
+                    json={
+                        "begin": begin,
+                        "end": end,
+                        "format": TEMP_IMG_FORMAT,
+                        "quality": PHOTO_QUALITY,
+                        "size": TEMP_IMG_SIZE,
+                    }
                 ) as resp:
                     if 200 <= resp.status < 300:
                         data = await resp.read()
@@ -156,7 +183,9 @@ class CommandHandler:
         url = self.photo_api_url
         try:
             async with aiohttp.ClientSession() as session:
-                async with session.get(url) as resp:
+                async with session.get(
+                    url, params=self.image_params
+                ) as resp:
                     if 200 <= resp.status < 300:
                         data: bytes = await resp.read()
                     else:
@@ -176,6 +205,30 @@ class CommandHandler:
             return data
 
         url = self.last_img_url
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(
+                    url, params=self.image_params
+                ) as resp:
+                    if 200 <= resp.status < 300:
+                        data: bytes = await resp.read()
+                    else:
+                        answer = await resp.text()
+                        self.logger.error(f"Api answer: {answer}")
+
+        except Exception as err:
+            self.logger.error(f"Api {url} error: {err}")
+
+        return data
+
+    async def photo_event_crop(self) -> typing.Optional[bytes]:
+        """Image of changed region of the last photo event.
+        """
+        data = None
+        url = self.photo_event_crop_url
+        if not url:
+            return data
+
         try:
             async with aiohttp.ClientSession() as session:
                 async with session.get(url) as resp:
@@ -209,6 +262,16 @@ class CommandHandler:
                                     )
                                     for dt, score in values.items()
                                 )
+
+                            crops = [
+                                event.get("crop")
+                                for event in data.get("events") or []
+                                if isinstance(event, dict)
+                                and event.get("crop")
+                            ]
+                            self.photo_event_crop_url = urljoin(
+                                self.api_host, crops[-1]
+                            ) if crops else None
                     else:
                         answer = await resp.text()
                         msg = f"Api answer: {answer}"
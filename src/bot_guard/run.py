@@ -53,7 +53,9 @@ async def event_watcher(logger: logging.Logger):
             )
             content.append(msg)
             logger.warning(f"Photo events: {len(events)}")
-            data = await handler.last_image()
+            data = (
+                await handler.photo_event_crop() or await handler.last_image()
+            )
 
         # temperature alert
         temperature = await handler.get_temperature()